@@ -19,23 +19,50 @@ Endpoints:
 """
 
 import argparse
+import base64
 import hashlib
+import json
+import multiprocessing
 import os
+import queue
 import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
 
-# Limit threading in numba/BLAS to avoid Metal command buffer races
-# when UMAP runs alongside MLX embedding generation
-os.environ['NUMBA_NUM_THREADS'] = '1'
+# Limit threading in BLAS to avoid Metal command buffer races with MLX
+# (UMAP itself runs in a separate worker process, see umap_worker.py)
 os.environ['OMP_NUM_THREADS'] = '1'
 os.environ['OPENBLAS_NUM_THREADS'] = '1'
 os.environ['MKL_NUM_THREADS'] = '1'
 
-import mlx.core as mx
 import numpy as np
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 
+try:
+    import blake3
+except ImportError:  # Optional: SIMD tree hash, falls back to hashlib
+    blake3 = None
+
+try:
+    import orjson
+except ImportError:  # Optional: Rust JSON encoder, falls back to jsonify
+    orjson = None
+
+import umap_worker
+
+# MLX stack, bound by _import_mlx() from main(). The spawn-context UMAP worker
+# re-imports this file as __mp_main__, so nothing heavier than Flask/numpy
+# may run at module import time.
+mx = None
+emb_load = None
+mlx_lm_load = None
+mlx_lm_stream_generate = None
+make_sampler = None
+
 # ---------------------------------------------------------------------------
 # Globals – populated at startup
 # ---------------------------------------------------------------------------
@@ -57,9 +84,58 @@ embedding_model = None
 embedding_tokenizer = None
 embedding_model_name = ""
 
-# UMAP reduction cache (keyed by content hash of embeddings)
-umap_reduction_cache: dict = {}
-umap_reducer = None  # Lazy-loaded on first /reduce call
+# Retrieval task prefix prepended to every embedding prompt. Its token IDs are
+# computed once at load time and spliced in front of each prompt's IDs; stays
+# None if splicing doesn't reproduce the tokenizer's own output for this model.
+EMBEDDING_TASK_PREFIX = "task: search result | query: "
+_embedding_prefix_ids = None
+_embedding_hf_tokenizer = None  # Fast (Rust) HF tokenizer when one is available
+# Request threads tokenize concurrently; a fast tokenizer reconfigures its
+# Rust-side truncation/padding per call and raises "Already borrowed" if two
+# threads do that at once
+_embedding_tokenizer_lock = threading.Lock()
+
+# Micro-batching for /api/embeddings: request threads enqueue token IDs and a
+# single consumer runs one padded forward pass per batch
+EMBED_MAX_BATCH = 32
+EMBED_MAX_WAIT_MS = 5
+_embed_queue: "queue.Queue[tuple[list, Future]]" = queue.Queue()
+_embed_worker = None
+
+# Batches are padded up to one of these row counts and sequences up to one of
+# these lengths (longer ones to a multiple of the last), so the mx.compile'd
+# forward pass only ever sees a handful of shapes
+EMBED_BATCH_BUCKETS = (1, 4, 8, 16, EMBED_MAX_BATCH)
+EMBED_SEQ_BUCKETS = (64, 128, 256, 512)
+_embed_forward = None  # mx.compile'd forward, set at load; None means eager
+
+# Padded input buffers reused across batches; only the batcher thread touches
+# them and mx.array() copies out, so no per-batch allocation is needed
+_embed_ids_buf = np.zeros((EMBED_MAX_BATCH, EMBED_SEQ_BUCKETS[-1]), dtype=np.int32)
+_embed_mask_buf = np.zeros((EMBED_MAX_BATCH, EMBED_SEQ_BUCKETS[-1]), dtype=np.int32)
+
+# UMAP reduction cache (keyed by content hash of embeddings), LRU-bounded by
+# entry count and an approximate byte budget
+umap_reduction_cache: "OrderedDict[str, dict]" = OrderedDict()
+_umap_cache_bytes: dict = {}  # content hash -> approximate size of the cached result
+_umap_cache_lock = threading.Lock()
+UMAP_CACHE_MAX_ENTRIES = 64
+UMAP_CACHE_MAX_BYTES = 512 * 1024 * 1024
+_UMAP_POINT_BYTES = 512  # Rough per-point footprint: dict, id, floats, metadata refs
+
+# On-disk copy of normalized /reduce coords so restarts don't repay the UMAP
+# fit. Set in main() from --umap-cache-dir; None disables persistence.
+# Only files named with UMAP_DISK_PREFIX are ever read, evicted or cleared,
+# so the directory may be shared.
+UMAP_CACHE_DIR = None
+UMAP_DISK_PREFIX = "umap-"
+UMAP_DISK_MAX_ENTRIES = 256  # Least recently used entries beyond this are deleted
+
+# Single-process pool that runs UMAP away from MLX's Metal state. Created on
+# first /reduce; recreated if the worker dies (e.g. a numba crash).
+_umap_executor = None
+_umap_executor_lock = threading.Lock()
+UMAP_MIN_POINTS = 200  # Below this, /reduce goes straight to PCA
 
 
 # ---------------------------------------------------------------------------
@@ -71,13 +147,30 @@ def _log(msg: str) -> None:
     print(msg, flush=True)
 
 
+def _import_mlx() -> None:
+    """Import the MLX stack into this module's globals (server process only)."""
+    global mx, emb_load, mlx_lm_load, mlx_lm_stream_generate, make_sampler
+    import mlx.core
+    from mlx_embeddings.utils import load as _emb_load
+    from mlx_lm import load as _mlx_lm_load
+    from mlx_lm import stream_generate as _mlx_lm_stream_generate
+    from mlx_lm.sample_utils import make_sampler as _make_sampler
+
+    mx = mlx.core
+    emb_load = _emb_load
+    mlx_lm_load = _mlx_lm_load
+    mlx_lm_stream_generate = _mlx_lm_stream_generate
+    make_sampler = _make_sampler
+
+
 def load_generation_model(model_id: str):
     """Load the text-generation model using mlx-lm."""
     global generation_model, generation_tokenizer, generation_model_name
-    from mlx_lm import load as mlx_lm_load
 
     _log(f"Loading generation model: {model_id} ...")
-    generation_model, generation_tokenizer = mlx_lm_load(model_id)
+    with _gpu_lock:
+        generation_model, generation_tokenizer = mlx_lm_load(model_id)
+    _sampler_for(0.7)  # Pre-build the default sampler
     generation_model_name = model_id.split("/")[-1]
     _log(f"Generation model loaded: {generation_model_name}")
 
@@ -85,14 +178,432 @@ def load_generation_model(model_id: str):
 def load_embedding_model(model_id: str):
     """Load the embedding model using mlx-embeddings."""
     global embedding_model, embedding_tokenizer, embedding_model_name
-    from mlx_embeddings.utils import load as emb_load
 
     _log(f"Loading embedding model: {model_id} ...")
-    embedding_model, embedding_tokenizer = emb_load(model_id)
+    with _gpu_lock:
+        model, embedding_tokenizer = emb_load(model_id)
+    _select_fast_tokenizer(model_id)
+    _prepare_embedding_prefix()
+    _compile_embed_forward(model)
+    _start_embed_worker()
+    embedding_model = model
     embedding_model_name = model_id.split("/")[-1]
     _log(f"Embedding model loaded: {embedding_model_name}")
 
 
+@lru_cache(maxsize=16)
+def _sampler_for(temperature: float):
+    """Build (once per temperature) the sampler passed to stream_generate."""
+    return make_sampler(temp=temperature)
+
+
+def _hf_embedding_tokenizer():
+    """mlx-embeddings wraps the tokenizer; return the inner HF tokenizer."""
+    if _embedding_hf_tokenizer is not None:
+        return _embedding_hf_tokenizer
+    return getattr(embedding_tokenizer, "_tokenizer", embedding_tokenizer)
+
+
+def _select_fast_tokenizer(model_id: str) -> None:
+    """Prefer a Rust-backed tokenizer so BPE never runs in Python."""
+    global _embedding_hf_tokenizer
+    hf_tokenizer = getattr(embedding_tokenizer, "_tokenizer", embedding_tokenizer)
+    if not getattr(hf_tokenizer, "is_fast", False):
+        try:
+            from transformers import AutoTokenizer
+            fast = AutoTokenizer.from_pretrained(model_id, use_fast=True)
+            if fast.is_fast:
+                hf_tokenizer = fast
+        except Exception as e:
+            _log(f"Fast tokenizer unavailable for {model_id} ({e}); using bundled tokenizer")
+    _embedding_hf_tokenizer = hf_tokenizer
+
+
+def _prepare_embedding_prefix() -> None:
+    """Tokenize the task prefix once, keeping it only if splicing is lossless."""
+    global _embedding_prefix_ids
+    hf_tokenizer = _hf_embedding_tokenizer()
+    try:
+        prefix_ids = hf_tokenizer(EMBEDDING_TASK_PREFIX, add_special_tokens=False)["input_ids"]
+        # The prefix ends in a space, where BPE/SentencePiece merges across the
+        # join: probe every leading character class a prompt can start with
+        probes = (
+            "hello world", "Where did I leave the diamond pickaxe?",
+            " x", "  x", "\tx", "\nx", "1x", "(x", "-x", "\"x", "é", "日本", "🙂",
+        )
+        for probe in probes:
+            expected = hf_tokenizer(EMBEDDING_TASK_PREFIX + probe, truncation=True)["input_ids"]
+            prompt_ids = hf_tokenizer(probe, add_special_tokens=False)["input_ids"]
+            if hf_tokenizer.build_inputs_with_special_tokens(prefix_ids + prompt_ids) != expected:
+                _log("Embedding prefix splicing differs from full tokenization; using full path")
+                return
+    except Exception as e:
+        _log(f"Embedding prefix precompute unavailable ({e}); using full path")
+        return
+    _embedding_prefix_ids = prefix_ids
+
+
+def _embedding_input_ids(prompt: str) -> np.ndarray:
+    """Token IDs (shape (1, L)) for the task-prefixed prompt."""
+    hf_tokenizer = _hf_embedding_tokenizer()
+    with _embedding_tokenizer_lock:
+        if _embedding_prefix_ids is not None:
+            prompt_ids = hf_tokenizer(prompt, add_special_tokens=False)["input_ids"]
+            ids = hf_tokenizer.build_inputs_with_special_tokens(_embedding_prefix_ids + prompt_ids)
+            if len(ids) <= hf_tokenizer.model_max_length:
+                return np.asarray([ids], dtype=np.int32)
+        # Overlong prompts go through the tokenizer so truncation matches exactly
+        prefixed = f"{EMBEDDING_TASK_PREFIX}{prompt}"
+        return hf_tokenizer(prefixed, return_tensors="np", padding=True, truncation=True)["input_ids"]
+
+
+def _content_hash(embeddings: np.ndarray) -> str:
+    """16-char hex digest of the embedding buffer, used as the UMAP cache key."""
+    buf = memoryview(np.ascontiguousarray(embeddings)).cast("B")
+    if blake3 is not None:
+        return blake3.blake3(buf).hexdigest(length=8)
+    return hashlib.sha256(buf).hexdigest()[:16]
+
+
+def _decode_embeddings_b64(data: dict) -> np.ndarray:
+    """Decode a base64 float32 embedding buffer and reshape it to (N, D)."""
+    dtype = data.get("dtype", "float32")
+    if dtype != "float32":
+        raise ValueError(f"unsupported dtype {dtype!r}")
+    shape = data.get("shape")
+    if not isinstance(shape, list) or len(shape) != 2:
+        raise ValueError("shape must be [N, D]")
+    buf = base64.b64decode(data["embeddings_b64"], validate=True)
+    return np.frombuffer(buf, dtype=np.float32).reshape(int(shape[0]), int(shape[1]))
+
+
+def _get_umap_executor() -> ProcessPoolExecutor:
+    """Return the UMAP worker pool, starting it on first use."""
+    global _umap_executor
+    with _umap_executor_lock:
+        if _umap_executor is None:
+            # spawn: never fork a process that has Metal/MLX state
+            _umap_executor = ProcessPoolExecutor(
+                max_workers=1, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _umap_executor
+
+
+def _discard_umap_executor() -> None:
+    """Drop a broken UMAP worker pool so the next call starts a fresh one."""
+    global _umap_executor
+    with _umap_executor_lock:
+        if _umap_executor is not None:
+            _umap_executor.shutdown(wait=False, cancel_futures=True)
+            _umap_executor = None
+
+
+def _reduce_in_worker(embeddings: np.ndarray, refit: bool):
+    """Run umap_worker.reduce in the worker process. Returns (coords, method, diagnostics)."""
+    # UMAP runs in its own process, so no _gpu_lock is needed here; the
+    # single-worker pool serializes concurrent /reduce calls
+    try:
+        return _get_umap_executor().submit(umap_worker.reduce, embeddings, refit).result()
+    except BrokenProcessPool as e:
+        # The worker died outright (not a Python exception) - restart it next time
+        _log(f"[UMAP] Worker process died ({e}), falling back to PCA")
+        _discard_umap_executor()
+        return umap_worker.reduce_pca(embeddings), "pca", {}
+
+
+def _umap_cache_get(content_hash: str):
+    """Return a cached /reduce result and mark it most recently used."""
+    with _umap_cache_lock:
+        result = umap_reduction_cache.get(content_hash)
+        if result is not None:
+            umap_reduction_cache.move_to_end(content_hash)
+        return result
+
+
+def _umap_cache_put(content_hash: str, result: dict) -> None:
+    """Insert a /reduce result, evicting least recently used entries over budget."""
+    with _umap_cache_lock:
+        umap_reduction_cache[content_hash] = result
+        umap_reduction_cache.move_to_end(content_hash)
+        _umap_cache_bytes[content_hash] = len(result["points"]) * _UMAP_POINT_BYTES
+        while len(umap_reduction_cache) > 1 and (
+            len(umap_reduction_cache) > UMAP_CACHE_MAX_ENTRIES
+            or sum(_umap_cache_bytes.values()) > UMAP_CACHE_MAX_BYTES
+        ):
+            evicted, _ = umap_reduction_cache.popitem(last=False)
+            _umap_cache_bytes.pop(evicted, None)
+
+
+def _umap_cache_clear() -> int:
+    """Drop every cached /reduce result and return how many were removed."""
+    with _umap_cache_lock:
+        count = len(umap_reduction_cache)
+        umap_reduction_cache.clear()
+        _umap_cache_bytes.clear()
+    if UMAP_CACHE_DIR and os.path.isdir(UMAP_CACHE_DIR):
+        for name in os.listdir(UMAP_CACHE_DIR):
+            if name.startswith(UMAP_DISK_PREFIX) and name.endswith((".npy", ".json")):
+                try:
+                    os.remove(os.path.join(UMAP_CACHE_DIR, name))
+                except OSError:
+                    pass
+    return count
+
+
+def _umap_disk_base(content_hash: str) -> str:
+    """Path prefix (without extension) of the persisted entry for content_hash."""
+    return os.path.join(UMAP_CACHE_DIR, UMAP_DISK_PREFIX + content_hash)
+
+
+def _umap_disk_evict() -> None:
+    """Delete the least recently used persisted entries beyond UMAP_DISK_MAX_ENTRIES."""
+    try:
+        entries = [
+            entry for entry in os.scandir(UMAP_CACHE_DIR)
+            if entry.name.startswith(UMAP_DISK_PREFIX) and entry.name.endswith(".npy")
+        ]
+        if len(entries) <= UMAP_DISK_MAX_ENTRIES:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - UMAP_DISK_MAX_ENTRIES]:
+            base = entry.path[:-len(".npy")]
+            for path in (base + ".npy", base + ".json"):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+    except OSError as e:
+        _log(f"[UMAP] Failed to evict persisted results: {e}")
+
+
+def _umap_disk_load(content_hash: str):
+    """Load (coords_3d, method) persisted for content_hash, or None on a miss."""
+    if not UMAP_CACHE_DIR:
+        return None
+    base = _umap_disk_base(content_hash)
+    try:
+        with open(base + ".json", "r", encoding="utf-8") as f:
+            method = json.load(f).get("method", "umap")
+        coords_3d = np.load(base + ".npy", mmap_mode="r")
+        os.utime(base + ".npy")  # Mark recently used for _umap_disk_evict
+        return coords_3d, method
+    except (OSError, ValueError):
+        return None
+
+
+def _umap_disk_save(content_hash: str, coords_3d: np.ndarray, method: str) -> None:
+    """Persist normalized coords for content_hash; failures are logged, not raised."""
+    if not UMAP_CACHE_DIR:
+        return
+    base = _umap_disk_base(content_hash)
+    try:
+        os.makedirs(UMAP_CACHE_DIR, exist_ok=True)
+        # Write to per-thread temp names then rename so a crash or a concurrent
+        # request for the same hash never leaves a torn entry
+        tmp_suffix = f".{threading.get_ident()}.tmp"
+        with open(base + ".npy" + tmp_suffix, "wb") as f:
+            np.save(f, coords_3d)
+        os.replace(base + ".npy" + tmp_suffix, base + ".npy")
+        with open(base + ".json" + tmp_suffix, "w", encoding="utf-8") as f:
+            json.dump({"method": method, "count": len(coords_3d)}, f)
+        os.replace(base + ".json" + tmp_suffix, base + ".json")
+    except OSError as e:
+        _log(f"[UMAP] Failed to persist {content_hash}: {e}")
+        return
+    _umap_disk_evict()
+
+
+def _build_reduce_result(content_hash: str, coords_3d: np.ndarray, ids: list, metadata: list, method: str) -> dict:
+    """Assemble the /reduce response body from normalized coords."""
+    # One bulk tolist() instead of per-element NumPy scalar boxing
+    points = [
+        {
+            "id": ids[i],
+            "x": x,
+            "y": y,
+            "z": z,
+            "metadata": metadata[i],
+        }
+        for i, (x, y, z) in enumerate(coords_3d.tolist())
+    ]
+    return {"points": points, "hash": content_hash, "count": len(points), "method": method}
+
+
+def _json_response(body: dict) -> Response:
+    """Serialize a large response body with orjson when available."""
+    if orjson is None:
+        return jsonify(body)
+    return Response(orjson.dumps(body, option=orjson.OPT_SERIALIZE_NUMPY), mimetype="application/json")
+
+
+def _encode_embedding(vec: np.ndarray, dtype: str) -> bytes:
+    """Serialize one embedding as float32, float16, or scaled int8 bytes.
+
+    int8 layout is a little-endian float32 scale followed by D int8 values;
+    vec ~= int8_values * scale. A single per-vector scale preserves cosine
+    similarity up to rounding error.
+    """
+    if dtype == "float32":
+        return vec.astype("<f4", copy=False).tobytes()
+    if dtype == "float16":
+        return vec.astype("<f2").tobytes()
+    if dtype == "int8":
+        scale = float(np.abs(vec).max()) / 127 or 1.0
+        quantized = np.clip(np.rint(vec / scale), -127, 127).astype(np.int8)
+        return np.float32(scale).astype("<f4").tobytes() + quantized.tobytes()
+    raise ValueError(f"Unsupported X-Embedding-Dtype {dtype!r} (use float32, float16 or int8)")
+
+
+# ---------------------------------------------------------------------------
+# Embedding micro-batching
+# ---------------------------------------------------------------------------
+
+def _start_embed_worker() -> None:
+    """Start the embedding batch consumer thread (idempotent)."""
+    global _embed_worker
+    if _embed_worker is None:
+        _embed_worker = threading.Thread(target=_embed_worker_loop, name="embed-batcher", daemon=True)
+        _embed_worker.start()
+
+
+def _collect_embed_batch(block: bool) -> list:
+    """Take up to EMBED_MAX_BATCH queued requests.
+
+    When block is False only requests that are already queued are taken,
+    so a batch still running on the GPU is never held up waiting for more.
+    """
+    batch = []
+    if block:
+        batch.append(_embed_queue.get())
+        deadline = time.monotonic() + EMBED_MAX_WAIT_MS / 1000
+        while len(batch) < EMBED_MAX_BATCH:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_embed_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+    while len(batch) < EMBED_MAX_BATCH:
+        try:
+            batch.append(_embed_queue.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+
+def _resolve_embed_batch(batch: list, embeds) -> None:
+    """Wait for a submitted batch and hand each row to its request's future."""
+    try:
+        with _gpu_lock:
+            vectors = np.array(embeds, dtype=np.float32)
+    except Exception as e:
+        for _, fut in batch:
+            fut.set_exception(e)
+        return
+    for (_, fut), vec in zip(batch, vectors):
+        fut.set_result(vec)
+
+
+def _embed_worker_loop() -> None:
+    """Drain queued embedding requests into batches and resolve their futures.
+
+    Batches are pipelined: while one forward pass runs on the GPU, requests
+    that queued up meanwhile are padded and submitted before the previous
+    result is read back.
+    """
+    pending = None  # (batch, lazy embeds) submitted but not yet read back
+    while True:
+        batch = _collect_embed_batch(block=pending is None)
+        submitted = None
+        if batch:
+            try:
+                submitted = (batch, _embed_batch([ids for ids, _ in batch]))
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+        if pending is not None:
+            _resolve_embed_batch(*pending)
+        pending = submitted
+
+
+def _compile_embed_forward(model) -> None:
+    """Wrap the embedding forward pass in mx.compile (traced once per shape)."""
+    global _embed_forward
+
+    def forward(input_ids, attention_mask):
+        return model(inputs=input_ids, attention_mask=attention_mask).text_embeds
+
+    try:
+        _embed_forward = mx.compile(forward)
+    except Exception as e:
+        _log(f"mx.compile unavailable for embedding model ({e}); running eagerly")
+        _embed_forward = None
+
+
+def _bucket(size: int, buckets: tuple) -> int:
+    """Smallest bucket that fits size, else size rounded up to a multiple of the last."""
+    for bucket in buckets:
+        if size <= bucket:
+            return bucket
+    return -(-size // buckets[-1]) * buckets[-1]
+
+
+def _embed_batch(batch_ids: list) -> "mx.array":
+    """Submit one padded forward pass over several token ID lists.
+
+    Returns the (batch, dim) embeddings as an mx.array whose evaluation has
+    been started with mx.async_eval; see _resolve_embed_batch.
+    """
+    global _embed_forward
+    hf_tokenizer = _hf_embedding_tokenizer()
+    pad_id = hf_tokenizer.pad_token_id or 0
+    pad_left = getattr(hf_tokenizer, "padding_side", "right") == "left"
+    rows = _bucket(len(batch_ids), EMBED_BATCH_BUCKETS)
+    max_len = _bucket(max(len(ids) for ids in batch_ids), EMBED_SEQ_BUCKETS)
+
+    if rows <= _embed_ids_buf.shape[0] and max_len <= _embed_ids_buf.shape[1]:
+        ids = _embed_ids_buf[:rows, :max_len]
+        mask = _embed_mask_buf[:rows, :max_len]
+        ids.fill(pad_id)
+        mask.fill(0)
+    else:
+        ids = np.full((rows, max_len), pad_id, dtype=np.int32)
+        mask = np.zeros((rows, max_len), dtype=np.int32)
+    for i, row in enumerate(batch_ids):
+        span = slice(max_len - len(row), max_len) if pad_left else slice(0, len(row))
+        ids[i, span] = row
+        mask[i, span] = 1
+    # Filler rows repeat the first prompt (an all-masked row can pool to NaN);
+    # their outputs are sliced off below
+    ids[len(batch_ids):] = ids[0]
+    mask[len(batch_ids):] = mask[0]
+
+    with _gpu_lock:
+        # Convert to mlx arrays (copies, so the padding buffers can be reused
+        # for the next batch while this one is still running)
+        input_ids = mx.array(ids)
+        attention_mask = mx.array(mask)
+
+        embeds = None
+        if _embed_forward is not None:
+            try:
+                embeds = _embed_forward(input_ids, attention_mask)
+            except Exception as e:
+                _log(f"Compiled embedding forward failed ({e}); falling back to eager")
+                _embed_forward = None
+        if embeds is None:
+            embeds = embedding_model(inputs=input_ids, attention_mask=attention_mask).text_embeds
+
+        # Text embeddings - shape is (batch, dim), minus the filler rows. Only
+        # the submission needs the lock; the host can prepare the next batch
+        # while this one runs
+        embeds = embeds[: len(batch_ids)]
+        mx.async_eval(embeds)
+        return embeds
+
+
 # ---------------------------------------------------------------------------
 # Routes
 # ---------------------------------------------------------------------------
@@ -147,31 +658,69 @@ def api_generate():
     if generation_model is None:
         return jsonify({"error": "Generation model not loaded"}), 503
 
-    from mlx_lm import generate as mlx_lm_generate
-    from mlx_lm.sample_utils import make_sampler
-
     data = request.get_json(force=True)
     prompt = data.get("prompt", "")
     options = data.get("options", {})
     temperature = options.get("temperature", 0.7)
     max_tokens = options.get("num_predict", 512)
 
-    sampler = make_sampler(temp=temperature)
+    sampler = _sampler_for(float(temperature))
+
+    if data.get("stream", False):
+        # Ollama-style NDJSON streaming. The lock is still held for the whole
+        # decode (MLX is single-stream), but clients see tokens as they land.
+        def stream():
+            with _gpu_lock:
+                start = time.time()
+                prompt_tokens = 0
+                completion_tokens = 0
+                for resp in mlx_lm_stream_generate(
+                    generation_model,
+                    generation_tokenizer,
+                    prompt=prompt,
+                    max_tokens=max_tokens,
+                    sampler=sampler,
+                ):
+                    prompt_tokens = resp.prompt_tokens
+                    completion_tokens = resp.generation_tokens
+                    if resp.text:
+                        yield json.dumps({
+                            "response": resp.text,
+                            "done": False,
+                            "model": "gemma3n:e2b",
+                        }) + "\n"
+                elapsed = time.time() - start
+            yield json.dumps({
+                "response": "",
+                "done": True,
+                "model": "gemma3n:e2b",
+                "eval_count": completion_tokens,
+                "prompt_eval_count": prompt_tokens,
+                "total_duration": int(elapsed * 1e9),
+            }) + "\n"
+
+        return Response(stream(), mimetype="application/x-ndjson")
 
     with _gpu_lock:
         start = time.time()
-        text = mlx_lm_generate(
+        # stream_generate reports token counts on each response, so we don't
+        # need to re-encode the prompt and completion afterwards
+        segments = []
+        prompt_tokens = 0
+        completion_tokens = 0
+        for resp in mlx_lm_stream_generate(
             generation_model,
             generation_tokenizer,
             prompt=prompt,
             max_tokens=max_tokens,
             sampler=sampler,
-        )
+        ):
+            segments.append(resp.text)
+            prompt_tokens = resp.prompt_tokens
+            completion_tokens = resp.generation_tokens
         elapsed = time.time() - start
 
-        # Rough token counts
-        prompt_tokens = len(generation_tokenizer.encode(prompt))
-        completion_tokens = len(generation_tokenizer.encode(text))
+    text = "".join(segments)
 
     return jsonify({
         "response": text,
@@ -192,25 +741,26 @@ def api_embeddings():
     data = request.get_json(force=True)
     prompt = data.get("prompt", "")
 
-    # Prepend retrieval task prefix for better embedding quality
-    prefixed = f"task: search result | query: {prompt}"
-
-    # mlx-embeddings wraps the tokenizer; use the inner HF tokenizer for encoding
-    hf_tokenizer = getattr(embedding_tokenizer, "_tokenizer", embedding_tokenizer)
-    inputs = hf_tokenizer(prefixed, return_tensors="np", padding=True, truncation=True)
-
-    # Convert to mlx arrays
-    input_ids = mx.array(inputs["input_ids"])
-    attention_mask = mx.array(inputs["attention_mask"])
-
-    with _gpu_lock:
-        output = embedding_model(inputs=input_ids, attention_mask=attention_mask)
-
-        # Extract text embeddings - shape is (batch, dim)
-        embeds = output.text_embeds
-        vec = embeds[0].tolist()
+    # Prepend retrieval task prefix for better embedding quality. Tokenize on
+    # the request thread, then hand off to the batcher for the forward pass.
+    ids = _embedding_input_ids(prompt)[0].tolist()
+    fut: Future = Future()
+    _embed_queue.put((ids, fut))
+    vec = fut.result()
+
+    # Opt-in raw binary body: 4 bytes/dim instead of ~15 bytes of JSON text,
+    # or 2 / 1 bytes/dim with X-Embedding-Dtype: float16 / int8
+    if "application/octet-stream" in request.headers.get("Accept", ""):
+        dtype = request.headers.get("X-Embedding-Dtype", "float32").lower()
+        try:
+            body = _encode_embedding(vec, dtype)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        resp = Response(body, mimetype="application/octet-stream")
+        resp.headers["X-Embedding-Dtype"] = dtype
+        return resp
 
-    return jsonify({"embedding": vec})
+    return jsonify({"embedding": vec.tolist()})
 
 
 # ---------------------------------------------------------------------------
@@ -222,16 +772,25 @@ def reduce_embeddings():
     """
     Reduce high-dimensional embeddings to 3D for visualization.
 
-    Input: { embeddings: [[...768 floats...], ...], ids: [...], metadata: [...] }
+    Input: { embeddings: [[...768 floats...], ...], ids: [...], metadata: [...], refit?: bool }
+       or: { embeddings_b64: "<base64 float32 buffer>", shape: [N, 768], ids, metadata }
     Output: { points: [{ id, x, y, z, metadata }, ...], hash, count }
-    """
-    global umap_reduction_cache
 
+    When most rows were already part of the previous UMAP fit, only the new
+    rows are transformed into that manifold. Pass refit=true to force a full fit.
+    """
     data = request.get_json(force=True)
-    if not data or "embeddings" not in data:
+    if not data or ("embeddings" not in data and "embeddings_b64" not in data):
         return jsonify({"error": "Missing embeddings field"}), 400
 
-    embeddings = np.array(data["embeddings"], dtype=np.float32)
+    if "embeddings_b64" in data:
+        # Binary fast path: a single memcpy instead of per-float list conversion
+        try:
+            embeddings = _decode_embeddings_b64(data)
+        except (ValueError, TypeError) as e:
+            return jsonify({"error": f"Invalid embeddings_b64 payload: {e}"}), 400
+    else:
+        embeddings = np.array(data["embeddings"], dtype=np.float32)
     ids = data.get("ids", [str(i) for i in range(len(embeddings))])
     metadata = data.get("metadata", [{}] * len(embeddings))
 
@@ -239,73 +798,56 @@ def reduce_embeddings():
         return jsonify({"error": "Need at least 5 embeddings for UMAP", "points": []}), 400
 
     # Hash for cache key
-    content_hash = hashlib.sha256(embeddings.tobytes()).hexdigest()[:16]
+    content_hash = _content_hash(embeddings)
 
-    if content_hash in umap_reduction_cache:
+    cached = _umap_cache_get(content_hash)
+    if cached is not None:
         _log(f"[UMAP] Cache hit for hash {content_hash}")
-        return jsonify(umap_reduction_cache[content_hash])
-
-    # Acquire GPU lock to prevent Metal command buffer races with
-    # concurrent /api/embeddings or /api/generate calls
-    with _gpu_lock:
-        method_used = "umap"
-        try:
-            # Lazy import umap to avoid startup delay if not used
-            import umap
-
-            # Fit UMAP reducer with appropriate n_neighbors
-            n_neighbors = min(15, max(2, len(embeddings) - 1))
-            reducer = umap.UMAP(
-                n_components=3,
-                n_neighbors=n_neighbors,
-                min_dist=0.1,
-                metric="cosine",
-                random_state=42,
-                n_jobs=1,  # Single-threaded to avoid crashes on Python 3.13 + Apple Silicon
-                low_memory=True,
-            )
-
-            _log(f"[UMAP] Reducing {len(embeddings)} embeddings to 3D...")
-            coords_3d = reducer.fit_transform(embeddings)
-        except Exception as e:
-            # Fallback to PCA if UMAP crashes (common on Python 3.13 + Apple Silicon)
-            _log(f"[UMAP] UMAP failed ({e}), falling back to PCA")
-            method_used = "pca"
-            from sklearn.decomposition import PCA
-            reducer = PCA(n_components=3, random_state=42)
-            coords_3d = reducer.fit_transform(embeddings)
+        return _json_response(cached)
+
+    persisted = _umap_disk_load(content_hash)
+    if persisted is not None and len(persisted[0]) == len(embeddings):
+        coords_3d, method_used = persisted
+        result = _build_reduce_result(content_hash, coords_3d, ids, metadata, method_used)
+        _umap_cache_put(content_hash, result)
+        _log(f"[UMAP] Disk cache hit for hash {content_hash}")
+        return _json_response(result)
+
+    if len(embeddings) < UMAP_MIN_POINTS:
+        # Too few neighbors for UMAP to estimate a manifold; PCA is both
+        # faster and at least as good here, and skips the worker/numba warmup
+        method_used = "pca-small"
+        coords_3d = umap_worker.reduce_pca(embeddings)
+        diagnostics = {}
+    else:
+        coords_3d, method_used, diagnostics = _reduce_in_worker(embeddings, bool(data.get("refit", False)))
 
     # Normalize to [-1, 1] range for Three.js
+    coords_3d = coords_3d.astype(np.float32)
     mins = coords_3d.min(axis=0)
-    maxs = coords_3d.max(axis=0)
-    ranges = maxs - mins + 1e-8  # Avoid division by zero
-    coords_3d = (coords_3d - mins) / ranges
-    coords_3d = coords_3d * 2 - 1
-
-    points = [
-        {
-            "id": ids[i],
-            "x": float(coords_3d[i, 0]),
-            "y": float(coords_3d[i, 1]),
-            "z": float(coords_3d[i, 2]),
-            "metadata": metadata[i],
-        }
-        for i in range(len(coords_3d))
-    ]
+    half_ranges = (np.ptp(coords_3d, axis=0) + 1e-8) * 0.5  # Avoid division by zero
+    np.subtract(coords_3d, mins, out=coords_3d)
+    np.divide(coords_3d, half_ranges, out=coords_3d)
+    np.subtract(coords_3d, 1.0, out=coords_3d)
 
-    result = {"points": points, "hash": content_hash, "count": len(points), "method": method_used}
-    umap_reduction_cache[content_hash] = result
-    _log(f"[UMAP] Reduction complete ({method_used}): {len(points)} points, cached as {content_hash}")
+    result = _build_reduce_result(content_hash, coords_3d, ids, metadata, method_used)
+    result.update(diagnostics)
+    _umap_cache_put(content_hash, result)
+    _umap_disk_save(content_hash, coords_3d, method_used)
+    _log(f"[UMAP] Reduction complete ({method_used}): {result['count']} points, cached as {content_hash}")
 
-    return jsonify(result)
+    return _json_response(result)
 
 
 @app.route("/clear-cache", methods=["POST"])
 def clear_umap_cache():
     """Clear the UMAP reduction cache."""
-    global umap_reduction_cache
-    count = len(umap_reduction_cache)
-    umap_reduction_cache = {}
+    count = _umap_cache_clear()
+    if _umap_executor is not None:
+        try:
+            _get_umap_executor().submit(umap_worker.reset).result()
+        except BrokenProcessPool:
+            _discard_umap_executor()
     _log(f"[UMAP] Cache cleared: {count} entries removed")
     return jsonify({"cleared": count})
 
@@ -315,7 +857,7 @@ def clear_umap_cache():
 # ---------------------------------------------------------------------------
 
 def main():
-    global LOAD_GENERATION, LOAD_EMBEDDING
+    global LOAD_GENERATION, LOAD_EMBEDDING, UMAP_CACHE_DIR
     parser = argparse.ArgumentParser(description="MLX-LM Sidecar Server")
     parser.add_argument(
         "--generation-model",
@@ -339,16 +881,25 @@ def main():
         action="store_true",
         help="Skip loading the embedding model (generation only)",
     )
+    parser.add_argument(
+        "--umap-cache-dir",
+        default=os.path.expanduser("~/.cache/mlx-sidecar/umap"),
+        help="Directory for persisted /reduce results (empty string disables)",
+    )
     args = parser.parse_args()
 
     LOAD_GENERATION = not args.skip_generation
     LOAD_EMBEDDING = not args.skip_embeddings
+    UMAP_CACHE_DIR = args.umap_cache_dir or None
+    _import_mlx()
 
     # Bind immediately so /health is reachable (returns 503 until models load)
     def run_server():
-        # threaded=False ensures requests are handled sequentially,
-        # preventing Metal command buffer races between concurrent GPU ops
-        app.run(host=args.host, port=args.port, debug=False, use_reloader=False, threaded=False)
+        # Requests are handled on their own threads so /health, /api/tags and
+        # cache hits never queue behind a long generation or UMAP fit. Every
+        # MLX/Metal touch goes through _gpu_lock, which is what actually
+        # prevents command buffer races between concurrent GPU ops.
+        app.run(host=args.host, port=args.port, debug=False, use_reloader=False, threaded=True)
 
     server_thread = threading.Thread(target=run_server, daemon=False)
     server_thread.start()
@@ -0,0 +1,183 @@
+"""
+UMAP worker for the MLX-LM sidecar.
+
+Runs in a separate process (see mlx_server._get_umap_executor) so UMAP's
+numba JIT and BLAS thread pools never share an address space with MLX's
+Metal command buffers. Keeps the reference UMAP fit between calls so new
+embeddings can be placed with transform() instead of a full refit.
+"""
+
+import hashlib
+import importlib.util
+import os
+
+# Numba's default workqueue threading layer is what deadlocks/crashes on
+# Python 3.13 + Apple Silicon. With TBB installed, UMAP can run multi-threaded
+# safely; otherwise pin numba to a single thread. Must be set before numba
+# is first imported (umap is imported lazily below).
+UMAP_PARALLEL = importlib.util.find_spec("tbb") is not None
+if UMAP_PARALLEL:
+    os.environ['NUMBA_THREADING_LAYER'] = 'tbb'
+    os.environ.pop('NUMBA_NUM_THREADS', None)
+else:
+    os.environ['NUMBA_NUM_THREADS'] = '1'
+
+import numpy as np
+
+try:
+    import blake3
+except ImportError:  # Optional: SIMD tree hash, falls back to hashlib
+    blake3 = None
+
+# Reference UMAP fit reused across /reduce calls: new rows are placed with
+# reducer.transform() instead of refitting the whole manifold. Holds
+# {"reducer", "pca", "dim", "index": {row_hash: row}, "coords", "fit_rows", "transformed"}.
+umap_reference = None
+UMAP_MIN_OVERLAP = 0.9  # Fraction of rows that must already be in the reference fit
+UMAP_MAX_DRIFT = 0.25  # Refit once transformed rows exceed this fraction of fitted rows
+
+# PCA prefilter ahead of UMAP: the kNN stage is dominated by distance
+# computations in the input dimension, and 50 components keep nearly all of
+# the neighborhood structure of 768-D embeddings
+PCA_PREFILTER_COMPONENTS = 50
+PCA_PREFILTER_MIN_DIM = 64
+
+
+def _log(msg: str) -> None:
+    """Print with flush so output is visible when running under scripts."""
+    print(msg, flush=True)
+
+
+def _row_hashes(embeddings: np.ndarray) -> list:
+    """Per-row digests used to match embeddings against the reference UMAP fit."""
+    rows = np.ascontiguousarray(embeddings)
+    if blake3 is not None:
+        return [blake3.blake3(memoryview(row).cast("B")).digest(length=16) for row in rows]
+    return [hashlib.blake2b(memoryview(row).cast("B"), digest_size=16).digest() for row in rows]
+
+
+def _fit_pca_prefilter(embeddings: np.ndarray):
+    """Fit the PCA prefilter if the input is wide enough to benefit.
+
+    Returns (pca_or_None, reduced_embeddings).
+    """
+    n_components = min(PCA_PREFILTER_COMPONENTS, len(embeddings) - 1)
+    if embeddings.shape[1] <= PCA_PREFILTER_MIN_DIM or n_components < 3:
+        return None, embeddings
+    from sklearn.decomposition import PCA
+    pca = PCA(n_components=n_components, svd_solver="randomized", random_state=42)
+    return pca, pca.fit_transform(embeddings)
+
+
+def _fit_umap_reference(umap, embeddings: np.ndarray, row_hashes: list) -> np.ndarray:
+    """Fit a fresh UMAP on embeddings and keep it as the reference for later calls."""
+    global umap_reference
+
+    pca, features = _fit_pca_prefilter(embeddings)
+
+    # Fit UMAP reducer with appropriate n_neighbors
+    n_neighbors = min(15, max(2, len(embeddings) - 1))
+    reducer = umap.UMAP(
+        n_components=3,
+        n_neighbors=n_neighbors,
+        min_dist=0.1,
+        metric="cosine",
+        # A fixed seed forces umap-learn onto a single thread, so only
+        # seed when we're single-threaded anyway
+        random_state=None if UMAP_PARALLEL else 42,
+        # Single-threaded without TBB to avoid crashes on Python 3.13 + Apple Silicon
+        n_jobs=-1 if UMAP_PARALLEL else 1,
+        low_memory=True,
+        transform_queue_size=4.0,
+    )
+
+    _log(f"[UMAP] Reducing {len(embeddings)} embeddings to 3D...")
+    coords_3d = reducer.fit_transform(features)
+
+    umap_reference = {
+        "reducer": reducer,
+        "pca": pca,
+        "dim": embeddings.shape[1],
+        "index": {h: i for i, h in enumerate(row_hashes)},
+        "coords": coords_3d,
+        "fit_rows": len(embeddings),
+        "transformed": 0,
+    }
+    return coords_3d
+
+
+def _transform_with_reference(embeddings: np.ndarray, row_hashes: list):
+    """Place embeddings using the reference fit, transforming only unseen rows.
+
+    Returns None when there is no usable reference or the overlap/drift
+    thresholds say the manifold should be refit.
+    """
+    ref = umap_reference
+    if ref is None or ref["dim"] != embeddings.shape[1]:
+        return None
+
+    known = [ref["index"].get(h) for h in row_hashes]
+    new_rows = [i for i, k in enumerate(known) if k is None]
+    if len(new_rows) > len(row_hashes) * (1 - UMAP_MIN_OVERLAP):
+        return None
+    if ref["transformed"] + len(new_rows) > ref["fit_rows"] * UMAP_MAX_DRIFT:
+        return None
+
+    coords_3d = np.empty((len(row_hashes), ref["coords"].shape[1]), dtype=ref["coords"].dtype)
+    seen_rows = [i for i, k in enumerate(known) if k is not None]
+    coords_3d[seen_rows] = ref["coords"][[known[i] for i in seen_rows]]
+
+    if new_rows:
+        _log(f"[UMAP] Transforming {len(new_rows)} new embeddings against reference fit...")
+        new_features = embeddings[new_rows]
+        if ref["pca"] is not None:
+            new_features = ref["pca"].transform(new_features)
+        new_coords = ref["reducer"].transform(new_features)
+        coords_3d[new_rows] = new_coords
+        base = len(ref["coords"])
+        ref["coords"] = np.concatenate([ref["coords"], new_coords])
+        for offset, i in enumerate(new_rows):
+            ref["index"][row_hashes[i]] = base + offset
+        ref["transformed"] += len(new_rows)
+
+    return coords_3d
+
+
+def reduce_pca(embeddings: np.ndarray) -> np.ndarray:
+    """Plain 3-component PCA, used for small inputs and when UMAP is unavailable."""
+    from sklearn.decomposition import PCA
+    reducer = PCA(n_components=3, svd_solver="randomized", random_state=42)
+    return reducer.fit_transform(embeddings)
+
+
+def _diagnostics() -> dict:
+    """Extra response fields describing the current reference fit."""
+    pca = umap_reference["pca"] if umap_reference else None
+    if pca is None:
+        return {}
+    return {"pca_explained_variance": float(pca.explained_variance_ratio_.sum())}
+
+
+def reduce(embeddings: np.ndarray, refit: bool = False):
+    """Reduce embeddings to 3D. Returns (coords_3d, method, diagnostics)."""
+    try:
+        # Lazy import umap to avoid startup delay if not used
+        import umap
+
+        row_hashes = _row_hashes(embeddings)
+        if not refit:
+            coords_3d = _transform_with_reference(embeddings, row_hashes)
+            if coords_3d is not None:
+                return coords_3d, "umap-incremental", _diagnostics()
+        coords_3d = _fit_umap_reference(umap, embeddings, row_hashes)
+        return coords_3d, "umap", _diagnostics()
+    except Exception as e:
+        # Fallback to PCA if UMAP crashes (common on Python 3.13 + Apple Silicon)
+        _log(f"[UMAP] UMAP failed ({e}), falling back to PCA")
+        return reduce_pca(embeddings), "pca", {}
+
+
+def reset() -> None:
+    """Drop the reference fit so the next call refits from scratch."""
+    global umap_reference
+    umap_reference = None
@@ -14,12 +14,21 @@ Usage:
 from __future__ import annotations
 
 import argparse
+import hashlib
 import json
 import os
 import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass, asdict, field
 from datetime import datetime, timezone
-from typing import Dict, List, Optional, Tuple
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Set, TextIO, Tuple
+
+try:
+    import ahocorasick
+except ImportError:  # Optional: pip install pyahocorasick; falls back to a substring scan
+    ahocorasick = None
 
 
 # --- ANSI escape stripping ---
@@ -45,6 +54,42 @@ HTTP_TIMING_RE = re.compile(r"\b(\d{3})\s+in\s+\d+ms\b")
 JSON_TAIL_RE = re.compile(r'(:\s*)\{.*$')
 JSON_ARRAY_TAIL_RE = re.compile(r'(:\s*)\[.*$')
 
+# The remaining token patterns folded into one alternation so normalize_line
+# needs three passes instead of nine. UUIDs and task IDs keep their own passes:
+# REQ/TASK IDs can contain them (e.g. "cognitive-task-<uuid>"), and a single
+# leftmost-match scan would swallow them whole. Alternatives are listed in the
+# order the substitutions used to be applied, which is also the priority when
+# two could match at the same spot.
+NORMALIZE_RE = re.compile(
+    "|".join(
+        [
+            rf"(?P<req>{REQ_RE.pattern})",
+            rf"(?P<hex>(?i:{HEX_RE.pattern}))",
+            rf"(?P<http>{HTTP_TIMING_RE.pattern})",
+            rf"(?P<dur>{DURATION_RE.pattern})",
+            rf"(?P<num>{NUM_RE.pattern})",
+            r"(?P<json>:\s*)[\{\[].*$",
+        ]
+    )
+)
+NORMALIZE_REPL = {
+    "req": "<REQ>",
+    "hex": "<HEX>",
+    # HTTP timing (e.g., "200 in 8ms" → "<STATUS> in <DUR>")
+    "http": "<STATUS> in <DUR>",
+    "dur": "<DUR>",
+    "num": "<NUM>",
+}
+
+
+def _normalize_repl(m: re.Match) -> str:
+    kind = m.lastgroup
+    if kind == "json":
+        # Truncate inline JSON tails — they carry per-event payloads that defeat clustering
+        return m.group("json") + "<JSON>"
+    return NORMALIZE_REPL[kind]
+
+
 # Common "structured-ish" prefixes you already use
 # Allow spaces inside brackets for names like [Minecraft Interface], [Core API], etc.
 COMPONENT_RE = re.compile(r"^\[([A-Za-z0-9_ :-]{2,64})\]\s*")
@@ -59,28 +104,26 @@ TS_MS_RE  = re.compile(r"^\d{13}\b")  # epoch ms
 
 def strip_ansi(s: str) -> str:
     """Remove ANSI escape sequences from a string."""
+    # Most lines have no escapes; a substring check is far cheaper than the regex
+    if "\x1b" not in s:
+        return s
     return ANSI_RE.sub("", s)
 
 
 def normalize_line(s: str) -> str:
-    s = strip_ansi(s).strip()
+    """Replace volatile tokens in an already ANSI-stripped line with placeholders."""
+    s = s.strip()
     s = UUID_RE.sub("<UUID>", s)
     s = TASK_RE.sub("<TASK>", s)
-    s = REQ_RE.sub("<REQ>", s)
-    s = HEX_RE.sub("<HEX>", s)
-    # Normalize HTTP timing first (e.g., "200 in 8ms" → "<STATUS> in <DUR>")
-    s = HTTP_TIMING_RE.sub(r"<STATUS> in <DUR>", s)
-    # Normalize remaining durations (e.g., "(3ms)" → "(<DUR>)")
-    s = DURATION_RE.sub("<DUR>", s)
-    s = NUM_RE.sub("<NUM>", s)
-    # Truncate inline JSON tails — they carry per-event payloads that defeat clustering
-    s = JSON_TAIL_RE.sub(r"\1<JSON>", s)
-    s = JSON_ARRAY_TAIL_RE.sub(r"\1<JSON>", s)
-    return s
-
-
-def detect_severity(raw: str) -> str:
-    l = raw.lower()
+    return NORMALIZE_RE.sub(_normalize_repl, s)
+
+
+def detect_severity(raw: str, lowered: bool = False) -> str:
+    # A chain of substring tests beats a combined regex here: CPython's
+    # str.__contains__ is a tuned fast search, and the categories are ranked
+    # (any FATAL hit outranks an earlier ERROR hit), which a leftmost-match
+    # regex can't express without a second pass
+    l = raw if lowered else raw.lower()
     if " fatal" in l or l.startswith("fatal"):
         return "FATAL"
     if " error" in l or l.startswith("error") or "exception" in l or "traceback" in l:
@@ -92,13 +135,17 @@ def detect_severity(raw: str) -> str:
     return "INFO"
 
 
+# Only a few dozen distinct components appear in practice; sharing one string
+# object per name keeps cluster keys small and makes key comparison an
+# identity check
+_COMPONENT_INTERN: Dict[str, str] = {}
+
+
 def extract_component(raw: str) -> Optional[str]:
-    m = COMPONENT_RE.match(raw)
+    m = COMPONENT_RE.match(raw) or EMOJI_PREFIX_RE.match(raw)
     if m:
-        return m.group(1)
-    m = EMOJI_PREFIX_RE.match(raw)
-    if m:
-        return m.group(1)
+        comp = m.group(1)
+        return _COMPONENT_INTERN.setdefault(comp, comp)
     return None
 
 
@@ -132,12 +179,31 @@ KEYWORDS = [
 ]
 
 
-def keyword_hits(s: str) -> List[str]:
-    hits = []
-    for k in KEYWORDS:
-        if k.lower() in s.lower():
-            hits.append(k)
-    return hits
+# Lowercased once at import instead of per line
+KEYWORDS_LOWER = [(k.lower(), k) for k in KEYWORDS]
+KEYWORD_ORDER = {k: i for i, k in enumerate(KEYWORDS)}
+
+if ahocorasick is not None:
+    # Single pass over the line reports every (possibly overlapping) keyword
+    KEYWORD_AUTOMATON = ahocorasick.Automaton()
+    for _lower, _k in KEYWORDS_LOWER:
+        KEYWORD_AUTOMATON.add_word(_lower, _k)
+    KEYWORD_AUTOMATON.make_automaton()
+else:
+    KEYWORD_AUTOMATON = None
+
+
+def keyword_hits(s: str, lowered: bool = False) -> List[str]:
+    """Keywords found in s (case-insensitive), in KEYWORDS order."""
+    if not lowered:
+        s = s.lower()
+    if KEYWORD_AUTOMATON is None:
+        return [k for lower, k in KEYWORDS_LOWER if lower in s]
+    found = {k for _, k in KEYWORD_AUTOMATON.iter(s)}
+    return sorted(found, key=KEYWORD_ORDER.__getitem__)
+
+
+MAX_EXAMPLES = 5
 
 
 @dataclass
@@ -150,6 +216,24 @@ class Cluster:
     last_seen_line: int
     examples: List[str] = field(default_factory=list)
     keywords: List[str] = field(default_factory=list)
+    # Bookkeeping for the clustering loop; left out of the JSON output
+    _examples_full: bool = field(default=False, repr=False)
+    _keyword_set: Set[str] = field(default_factory=set, repr=False)
+
+    def add_example(self, text: str) -> None:
+        if not self._examples_full:
+            self.examples.append(text)
+            self._examples_full = len(self.examples) >= MAX_EXAMPLES
+
+    def add_keywords(self, hits: Iterable[str]) -> None:
+        """Record keyword hits, keeping first-seen order in `keywords`."""
+        for h in hits:
+            if h not in self._keyword_set:
+                self._keyword_set.add(h)
+                self.keywords.append(h)
+
+    def to_dict(self) -> dict:
+        return {k: v for k, v in asdict(self).items() if not k.startswith("_")}
 
 
 @dataclass
@@ -161,17 +245,25 @@ class CollapsedLine:
     block_text: str = ""
 
 
-def collapse_brace_blocks(lines: List[Tuple[int, str]]) -> List[CollapsedLine]:
+def read_log_lines(f: TextIO) -> Iterator[Tuple[int, str]]:
+    """Yield (line number, ANSI-stripped line) for every non-blank line."""
+    for idx, raw in enumerate(f, start=1):
+        raw = strip_ansi(raw).rstrip("\n")
+        if not raw.strip():
+            continue
+        yield idx, raw
+
+
+def collapse_brace_blocks(lines: Iterable[Tuple[int, str]]) -> Iterator[CollapsedLine]:
     """Collapse pretty-printed object dumps into single synthetic lines.
 
     Detects lines ending with '{' and reads until braces re-balance,
     replacing the entire block with: PREFIX <OBJECT>.
     Preserves the full block text for severity/keyword detection.
+    Lines are consumed lazily, so only the current block is held in memory.
     """
-    result: List[CollapsedLine] = []
-    i = 0
-    while i < len(lines):
-        idx, line = lines[i]
+    it = iter(lines)
+    for idx, line in it:
         stripped = line.rstrip()
 
         # Check if line ends with '{' (start of a pretty-printed object)
@@ -179,53 +271,47 @@ def collapse_brace_blocks(lines: List[Tuple[int, str]]) -> List[CollapsedLine]:
             prefix = stripped[:-1].rstrip()
             depth = stripped.count("{") - stripped.count("}")
             block_lines = [line]
-            i += 1
             # Read until braces balance
-            while i < len(lines) and depth > 0:
-                _, bline = lines[i]
-                depth += bline.count("{") - bline.count("}")
-                block_lines.append(bline)
-                i += 1
+            if depth > 0:
+                for _, bline in it:
+                    depth += bline.count("{") - bline.count("}")
+                    block_lines.append(bline)
+                    if depth <= 0:
+                        break
             # Emit a single synthetic line with the prefix
             synthetic = f"{prefix} <OBJECT>" if prefix else "<OBJECT>"
             full_block = "\n".join(block_lines)
-            result.append(CollapsedLine(idx=idx, text=synthetic, block_text=full_block))
+            yield CollapsedLine(idx=idx, text=synthetic, block_text=full_block)
         else:
-            result.append(CollapsedLine(idx=idx, text=line, block_text=line))
-            i += 1
-    return result
+            yield CollapsedLine(idx=idx, text=line, block_text=line)
 
 
-def process_log(logfile: str) -> List[Cluster]:
-    clusters: Dict[Tuple[str, str, str], Cluster] = {}
+ClusterKey = Tuple[str, str, bytes]
 
-    # Phase 1: read all lines and strip ANSI (keep all lines for brace balancing)
-    raw_lines: List[Tuple[int, str]] = []
-    with open(logfile, "r", encoding="utf-8", errors="replace") as f:
-        for idx, raw in enumerate(f, start=1):
-            raw = strip_ansi(raw).rstrip("\n")
-            if not raw.strip():
-                continue
-            raw_lines.append((idx, raw))
+# Collapsed lines handed to a worker process at a time when --jobs > 1
+CLUSTER_BATCH_LINES = 20000
 
-    # Phase 2: collapse brace-delimited object dumps (needs all lines for balance)
-    collapsed = collapse_brace_blocks(raw_lines)
 
-    # Phase 3: drop punctuation-only lines that survived collapse
-    collapsed = [cl for cl in collapsed if not PUNCT_ONLY_RE.match(cl.text)]
+def cluster_lines(lines: Iterable[CollapsedLine]) -> Dict[ClusterKey, Cluster]:
+    """Cluster collapsed lines; the result dict is in first-seen order."""
+    # Keyed by a 128-bit digest of the normalized line; the readable form
+    # lives only in Cluster.signature
+    clusters: Dict[ClusterKey, Cluster] = {}
 
-    # Phase 4: cluster
-    for cl in collapsed:
-        # Re-check after collapse — some synthetic lines may be empty
-        if not cl.text.strip():
+    for cl in lines:
+        # Drop punctuation-only lines that survived collapse; re-check
+        # emptiness since some synthetic lines may be empty
+        if PUNCT_ONLY_RE.match(cl.text) or not cl.text.strip():
             continue
 
-        # Use block_text for severity/keyword detection (captures content inside objects)
-        sev = detect_severity(cl.block_text)
+        # Use block_text for severity/keyword detection (captures content inside objects);
+        # lowercase it once for both
+        block_lower = cl.block_text.lower()
+        sev = detect_severity(block_lower, lowered=True)
         comp = extract_component(cl.text) or "<no-component>"
         norm = normalize_line(cl.text)
 
-        key = (comp, sev, norm)
+        key = (comp, sev, hashlib.blake2b(norm.encode(), digest_size=16).digest())
 
         if key not in clusters:
             clusters[key] = Cluster(
@@ -240,11 +326,63 @@ def process_log(logfile: str) -> List[Cluster]:
         c = clusters[key]
         c.count += 1
         c.last_seen_line = cl.idx
-        if len(c.examples) < 5:
-            c.examples.append(cl.text)
-        for h in keyword_hits(cl.block_text):
-            if h not in c.keywords:
-                c.keywords.append(h)
+        c.add_example(cl.text)
+        c.add_keywords(keyword_hits(block_lower, lowered=True))
+
+    return clusters
+
+
+def merge_clusters(into: Dict[ClusterKey, Cluster], later: Dict[ClusterKey, Cluster]) -> None:
+    """Fold clusters from a later stretch of the log into `into`."""
+    for key, c in later.items():
+        m = into.get(key)
+        if m is None:
+            into[key] = c
+            continue
+        m.count += c.count
+        m.last_seen_line = c.last_seen_line
+        for ex in c.examples:
+            m.add_example(ex)
+        m.add_keywords(c.keywords)
+
+
+def _batched(it: Iterable[CollapsedLine], n: int) -> Iterator[List[CollapsedLine]]:
+    it = iter(it)
+    while True:
+        batch = list(islice(it, n))
+        if not batch:
+            return
+        yield batch
+
+
+def process_log(logfile: str, jobs: int = 1) -> List[Cluster]:
+    # Streamed pipeline: strip ANSI -> collapse brace-delimited object dumps ->
+    # drop punctuation-only lines -> cluster. Memory is bounded by the largest
+    # object dump rather than the size of the log.
+    #
+    # With jobs > 1, reading and brace collapsing (cheap, but needs to see the
+    # lines in order) stay in this process, and batches of collapsed lines are
+    # clustered in worker processes. Partial results are merged in submission
+    # order so the output matches a single-process run exactly.
+    with open(logfile, "r", encoding="utf-8", errors="replace") as f:
+        batches = _batched(collapse_brace_blocks(read_log_lines(f)), CLUSTER_BATCH_LINES)
+        first = next(batches, [])
+        if jobs <= 1 or len(first) < CLUSTER_BATCH_LINES:
+            # Serial path, also taken when the whole log fits in one batch
+            clusters = cluster_lines(first)
+            for batch in batches:
+                merge_clusters(clusters, cluster_lines(batch))
+        else:
+            clusters = {}
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                # Bounded window of in-flight batches keeps memory flat
+                pending = deque([pool.submit(cluster_lines, first)])
+                for batch in batches:
+                    pending.append(pool.submit(cluster_lines, batch))
+                    if len(pending) >= jobs * 2:
+                        merge_clusters(clusters, pending.popleft().result())
+                while pending:
+                    merge_clusters(clusters, pending.popleft().result())
 
     sev_weight = {"FATAL": 4, "ERROR": 3, "WARN": 2, "INFO": 1}
     ranked = sorted(
@@ -260,7 +398,7 @@ def write_outputs(ranked: List[Cluster], logfile: str, outdir: str, top: int, mi
 
     json_path = os.path.join(outdir, "runlog_clusters.json")
     with open(json_path, "w", encoding="utf-8") as jf:
-        json.dump([asdict(c) for c in ranked], jf, indent=2)
+        json.dump([c.to_dict() for c in ranked], jf, indent=2)
 
     md_path = os.path.join(outdir, "runlog_summary.md")
     now = datetime.now(timezone.utc).isoformat()
@@ -323,9 +461,10 @@ def main() -> None:
     ap.add_argument("--out", default="artifacts/runlog-audit", help="Output directory")
     ap.add_argument("--top", type=int, default=50, help="Top N clusters to include")
     ap.add_argument("--min", type=int, default=2, help="Minimum count to include in summary")
+    ap.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Worker processes for clustering (1 = serial)")
     args = ap.parse_args()
 
-    ranked = process_log(args.logfile)
+    ranked = process_log(args.logfile, args.jobs)
     write_outputs(ranked, args.logfile, args.out, args.top, args.min)
 
 
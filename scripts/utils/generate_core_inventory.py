@@ -15,16 +15,29 @@ Author: @darianrosebrook
 """
 
 import ast
+import copy
 import gc
+import hashlib
+import importlib.util
+import inspect
+import itertools
 import json
+import multiprocessing
+import os
 import re
 import signal
 import subprocess
 import sys
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from dataclasses import dataclass, field
 from datetime import datetime
 from functools import lru_cache
+from operator import itemgetter
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
@@ -63,6 +76,10 @@ def _signal_handler(signum, frame):
 
     sys.exit(130)  # Standard exit code for Ctrl+C
 
+# Let the CUDA caching allocator grow segments in place instead of carving
+# new ones as prompt lengths vary (read at first CUDA allocation)
+os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", "expandable_segments:True")
+
 # Try to import transformers for faster generation
 try:
     import torch
@@ -74,6 +91,11 @@ except ImportError:
     torch = None  # Prevent NameError when checking torch.backends later
     LogitsProcessor = None
 
+try:
+    import orjson
+except ImportError:  # Optional: faster JSON writes, falls back to json
+    orjson = None
+
 
 # Model path discovery - try multiple common locations
 def _discover_model_path() -> Optional[str]:
@@ -100,9 +122,49 @@ DEFAULT_MODEL_PATH = _discover_model_path()
 _GLOBAL_MODEL = None
 _GLOBAL_TOKENIZER = None
 _GLOBAL_DEVICE = None
+_GLOBAL_DRAFT_MODEL = None  # Optional small model for assisted (speculative) decoding
+_GLOBAL_VLLM = None  # vLLM engine when --engine vllm is in use
+
+# Upper bound on cached file content (in characters, ~bytes for source files)
+MAX_CACHE_BYTES = int(os.environ.get("MAX_CACHE_BYTES", 256 * 1024 * 1024))
+
+
+class _FileContentCache:
+    """Thread-safe LRU of file contents, bounded by total size rather than count."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            content = self._entries.get(key)
+            if content is not None:
+                self._entries.move_to_end(key)
+            return content
+
+    def put(self, key: str, content: str) -> None:
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= len(old)
+            self._entries[key] = content
+            self.total_bytes += len(content)
+            # Evict least recently used entries, but always keep the newest one
+            while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self.total_bytes -= len(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
 
 # File content cache to avoid repeated reads
-_FILE_CONTENT_CACHE: Dict[str, str] = {}
+_FILE_CONTENT_CACHE = _FileContentCache(MAX_CACHE_BYTES)
 
 
 @dataclass
@@ -119,18 +181,19 @@ class FileContext:
 def _get_file_content(file_path: Path) -> str:
     """Get file content with caching."""
     key = str(file_path)
-    if key not in _FILE_CONTENT_CACHE:
+    content = _FILE_CONTENT_CACHE.get(key)
+    if content is None:
         try:
-            _FILE_CONTENT_CACHE[key] = file_path.read_text(encoding="utf-8")
+            content = file_path.read_text(encoding="utf-8")
         except Exception:
-            _FILE_CONTENT_CACHE[key] = ""
-    return _FILE_CONTENT_CACHE[key]
+            content = ""
+        _FILE_CONTENT_CACHE.put(key, content)
+    return content
 
 
 def _clear_file_cache():
     """Clear the file content cache to free memory."""
-    global _FILE_CONTENT_CACHE
-    _FILE_CONTENT_CACHE = {}
+    _FILE_CONTENT_CACHE.clear()
 
 # Project context for AI understanding
 PROJECT_CONTEXT = """
@@ -168,8 +231,9 @@ MODULE_CATEGORIES = {
     "mcp-server": "MCP server integration",
 }
 
-# Extended action verbs for description parsing
-ACTION_VERBS = [
+# Extended action verbs for description parsing (a tuple so str.startswith
+# can test them all in one call)
+ACTION_VERBS = (
     # Primary actions
     "Provides", "Implements", "Defines", "Contains", "Manages",
     "Handles", "Processes", "Creates", "Generates", "Validates",
@@ -186,12 +250,16 @@ ACTION_VERBS = [
     "Ranks", "Selects", "Filters", "Prunes", "Backtracks",
     # Orchestration actions
     "Orchestrates", "Configures", "Initializes", "Registers", "Binds",
-]
+)
+
 
+def get_file_metadata(file_path: Path, stat: Optional[os.stat_result] = None) -> Dict:
+    """Get file metadata.
 
-def get_file_metadata(file_path: Path) -> Dict:
-    """Get file metadata."""
-    stat = file_path.stat()
+    Pass a stat result the caller already holds to avoid a second stat call.
+    """
+    if stat is None:
+        stat = file_path.stat()
     mtime = datetime.fromtimestamp(stat.st_mtime)
 
     try:
@@ -201,7 +269,7 @@ def get_file_metadata(file_path: Path) -> Dict:
 
     # Use cached content for line count
     content = _get_file_content(file_path)
-    line_count = len(content.splitlines()) if content else 0
+    line_count = _line_count(content)
 
     return {
         "created": ctime.isoformat(),
@@ -210,13 +278,76 @@ def get_file_metadata(file_path: Path) -> Dict:
         "size": stat.st_size,
         "size_bytes": stat.st_size,  # Alias for consistency
         "lines": line_count,
+        "content_hash": _content_hash(content),
+        "has_main": 'if __name__' in content and '__main__' in content,
     }
 
 
+def _content_hash(content: str) -> str:
+    """Digest identifying a file's content, used to reuse prior descriptions."""
+    return hashlib.blake2b(content.encode("utf-8", "surrogatepass"), digest_size=16).hexdigest()
+
+
+def _line_count(content: str) -> int:
+    """len(content.splitlines()) without building the list of lines."""
+    if not content:
+        return 0
+    if OTHER_LINE_BREAKS_RE.search(content):
+        # "\r", form feeds etc. also split lines; rare enough to do it slowly
+        return len(content.splitlines())
+    return content.count("\n") + (0 if content.endswith("\n") else 1)
+
+
 def count_lines(file_path: Path) -> int:
     """Count lines in file (uses cache)."""
-    content = _get_file_content(file_path)
-    return len(content.splitlines()) if content else 0
+    return _line_count(_get_file_content(file_path))
+
+
+TODO_PRIORITIES = ("P0-GOV", "P1-METRIC", "P2-QUAL", "P3-UX", "untagged")
+
+
+def _empty_todos() -> Dict[str, List]:
+    """Fresh per-priority TODO buckets (lists are filled in place)."""
+    return {priority: [] for priority in TODO_PRIORITIES}
+
+
+# Tagged TODO anywhere on a line; also covers the "// TODO[...]:" form
+TODO_TAGGED_RE = re.compile(
+    r'#?\s*TODO\[(P\d-[A-Z]+)\]:\s*(.+?)(?=\n|$)',
+    re.IGNORECASE | re.MULTILINE
+)
+TODO_WORD_RE = re.compile(r"TODO", re.IGNORECASE)
+# Line boundaries str.splitlines() honours besides "\n"
+OTHER_LINE_BREAKS_RE = re.compile("[\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]")
+
+
+def _todo_candidate_lines(content: str):
+    """Yield (line_number, line) for each line of content that mentions TODO.
+
+    Finds candidates with one scan of the whole file instead of testing
+    every line, so files without TODOs cost a single regex search.
+    """
+    if not TODO_WORD_RE.search(content):
+        return
+    if OTHER_LINE_BREAKS_RE.search(content):
+        # Rare: keep line numbers consistent with str.splitlines()
+        for line_num, line in enumerate(content.splitlines(), start=1):
+            if "TODO" in line.upper():
+                yield line_num, line
+        return
+
+    line_num = 1
+    line_start = 0
+    last_yielded = -1
+    for m in TODO_WORD_RE.finditer(content):
+        start = content.rfind("\n", 0, m.start()) + 1
+        if start == last_yielded:
+            continue  # Another TODO on a line already reported
+        line_num += content.count("\n", line_start, start)
+        line_start = start
+        end = content.find("\n", start)
+        yield line_num, content[start:] if end == -1 else content[start:end]
+        last_yielded = start
 
 
 def scan_todos(file_path: Path, base_path: Path = None) -> Dict[str, List[Dict[str, any]]]:
@@ -227,29 +358,14 @@ def scan_todos(file_path: Path, base_path: Path = None) -> Dict[str, List[Dict[s
     Returns dict with keys: P0-GOV, P1-METRIC, P2-QUAL, P3-UX, untagged
     Each value is a list of dicts with: line_number, content, file_path
     """
-    todo_pattern = re.compile(
-        r'#?\s*TODO\[(P\d-[A-Z]+)\]:\s*(.+?)(?=\n|$)',
-        re.IGNORECASE | re.MULTILINE
-    )
-    todo_js_pattern = re.compile(
-        r'//\s*TODO\[(P\d-[A-Z]+)\]:\s*(.+?)$',
-        re.IGNORECASE | re.MULTILINE
-    )
 
-    todos_by_priority = {
-        "P0-GOV": [],
-        "P1-METRIC": [],
-        "P2-QUAL": [],
-        "P3-UX": [],
-        "untagged": []
-    }
+    todos_by_priority = _empty_todos()
 
     try:
         content = _get_file_content(file_path)  # Use cached content
         if not content:
             return todos_by_priority
-        lines = content.splitlines()
-        
+
         # Calculate relative path if base_path provided
         if base_path:
             try:
@@ -259,8 +375,8 @@ def scan_todos(file_path: Path, base_path: Path = None) -> Dict[str, List[Dict[s
         else:
             rel_path = str(file_path)
         
-        for line_num, line in enumerate(lines, start=1):
-            match = todo_pattern.search(line) or todo_js_pattern.search(line)
+        for line_num, line in _todo_candidate_lines(content):
+            match = TODO_TAGGED_RE.search(line)
             if match:
                 priority_tag = match.group(1).upper()
                 todo_content = match.group(2).strip()
@@ -277,7 +393,7 @@ def scan_todos(file_path: Path, base_path: Path = None) -> Dict[str, List[Dict[s
                         "content": f"[{priority_tag}] {todo_content}",
                         "file_path": rel_path
                     })
-            elif "TODO" in line.upper():
+            else:
                 stripped = line.strip()
                 is_comment = stripped and (
                     stripped.startswith("#")
@@ -348,6 +464,16 @@ def _extract_enum_values(node: ast.ClassDef) -> List[str]:
     return values[:10]  # Limit to 10 values
 
 
+TS_JSDOC_RE = re.compile(r"/\*\*([\s\S]*?)\*/")
+TS_IMPORT_FROM_RE = re.compile(r'import\s+.*?\s+from\s+["\']([^"\']+)["\']')
+TS_IMPORT_BARE_RE = re.compile(r'import\s+["\']([^"\']+)["\']')
+TS_CLASS_RE = re.compile(r"\bclass\s+(\w+)")
+TS_FUNC_RE = re.compile(r"\b(?:async\s+)?function\s+(\w+)\s*\(")
+TS_EXPORT_FUNC_RE = re.compile(r"\b(?:export\s+)?(?:async\s+)?function\s+(\w+)\s*\(")
+TS_CONST_RE = re.compile(r"\b(?:const|let)\s+([A-Z][A-Z0-9_]+)\s*=")
+WHITESPACE_RUN_RE = re.compile(r"\s+")
+
+
 def extract_typescript_context(content: str) -> Dict:
     """Extract context from TypeScript/JavaScript via regex (no AST)."""
     imports = []
@@ -355,21 +481,21 @@ def extract_typescript_context(content: str) -> Dict:
     functions = []
     docstring = ""
     constants = []
-    jsdoc_match = re.search(r"/\*\*([\s\S]*?)\*/", content)
+    jsdoc_match = TS_JSDOC_RE.search(content)
     if jsdoc_match:
-        docstring = re.sub(r"\s+", " ", jsdoc_match.group(1)).strip()[:500]
-    for m in re.finditer(r'import\s+.*?\s+from\s+["\']([^"\']+)["\']', content):
+        docstring = WHITESPACE_RUN_RE.sub(" ", jsdoc_match.group(1)).strip()[:500]
+    for m in TS_IMPORT_FROM_RE.finditer(content):
         imports.append(m.group(1))
-    for m in re.finditer(r'import\s+["\']([^"\']+)["\']', content):
+    for m in TS_IMPORT_BARE_RE.finditer(content):
         imports.append(m.group(1))
-    for m in re.finditer(r"\bclass\s+(\w+)", content):
+    for m in TS_CLASS_RE.finditer(content):
         classes.append(m.group(1))
-    for m in re.finditer(r"\b(?:async\s+)?function\s+(\w+)\s*\(", content):
+    for m in TS_FUNC_RE.finditer(content):
         functions.append(m.group(1))
-    for m in re.finditer(r"\b(?:export\s+)?(?:async\s+)?function\s+(\w+)\s*\(", content):
+    for m in TS_EXPORT_FUNC_RE.finditer(content):
         if m.group(1) not in functions:
             functions.append(m.group(1))
-    for m in re.finditer(r"\b(?:const|let)\s+([A-Z][A-Z0-9_]+)\s*=", content):
+    for m in TS_CONST_RE.finditer(content):
         constants.append(m.group(1))
     return {
         "content": content,
@@ -384,6 +510,119 @@ def extract_typescript_context(content: str) -> Dict:
     }
 
 
+# Python files above this size skip ast.parse (whose node allocation dominates
+# time and peak memory on generated/vendored modules) for a regex scan of
+# top-level definitions
+MAX_AST_PARSE_CHARS = 200_000
+
+PY_DOCSTRING_RE = re.compile(r'\A(?:[ \t]*(?:#[^\n]*)?\n)*[ \t]*[rRuU]?("""|\'\'\')(.*?)\1', re.DOTALL)
+PY_IMPORT_RE = re.compile(
+    r"^(?:import[ \t]+([\w.]+(?:[ \t]*,[ \t]*[\w.]+)*)|from[ \t]+([\w.]+)[ \t]+import\b)",
+    re.MULTILINE,
+)
+PY_DEF_RE = re.compile(r"^(class|def|async[ \t]+def)[ \t]+(\w+)", re.MULTILINE)
+PY_CONSTANT_RE = re.compile(r"^(_*[A-Z][A-Z0-9_]*)[ \t]*=(?!=)", re.MULTILINE)
+
+
+# Classes/functions listed in a module summary; details past this are never built
+SUMMARY_DETAIL_LIMIT = 8
+
+
+def _build_python_summary(
+    docstring: str,
+    constants: List[str],
+    class_details: List[str],
+    function_details: List[str],
+    import_details: List[str],
+    class_count: int,
+    function_count: int,
+) -> str:
+    """Assemble the prompt summary block for a Python module.
+
+    The *_details lists may be capped at SUMMARY_DETAIL_LIMIT; the counts
+    give the module's full totals.
+    """
+    summary_parts = []
+
+    if docstring:
+        # Include full module docstring (not truncated)
+        summary_parts.append(f"MODULE DOCSTRING:\n{docstring}")
+
+    if constants:
+        summary_parts.append(f"CONSTANTS: {', '.join(constants[:15])}")
+
+    if class_details:
+        summary_parts.append(
+            f"CLASSES ({class_count}):\n"
+            + "\n".join(f"  - {c}" for c in class_details[:SUMMARY_DETAIL_LIMIT])
+        )
+
+    if function_details:
+        summary_parts.append(
+            f"FUNCTIONS ({function_count}):\n"
+            + "\n".join(f"  - {f}" for f in function_details[:SUMMARY_DETAIL_LIMIT])
+        )
+
+    if import_details:
+        # Group imports by source
+        core_imports = [i for i in import_details if "core." in i]
+        other_imports = [i for i in import_details if "core." not in i]
+        if core_imports:
+            summary_parts.append(f"STERLING IMPORTS: {', '.join(core_imports[:10])}")
+        if other_imports:
+            summary_parts.append(f"EXTERNAL IMPORTS: {', '.join(other_imports[:8])}")
+
+    return "\n\n".join(summary_parts)
+
+
+def extract_python_context_regex(content: str) -> Dict:
+    """Extract top-level Python context via regex, for files too large to parse.
+
+    Only column-0 statements are matched, so nested defs and methods are
+    skipped just as in the ast walk; signatures and docstrings beyond the
+    module docstring are not recovered.
+    """
+    docstring_match = PY_DOCSTRING_RE.match(content)
+    docstring = inspect.cleandoc(docstring_match.group(2)) if docstring_match else ""
+
+    imports = []
+    import_details = []
+    for m in PY_IMPORT_RE.finditer(content):
+        if m.group(2):
+            imports.append(m.group(2))
+            import_details.append(f"from {m.group(2)} import ...")
+            continue
+        for name in m.group(1).split(","):
+            name = name.strip()
+            imports.append(name)
+            import_details.append(f"import {name}")
+
+    functions = []
+    classes = []
+    for m in PY_DEF_RE.finditer(content):
+        (classes if m.group(1) == "class" else functions).append(m.group(2))
+    constants = [m.group(1) for m in PY_CONSTANT_RE.finditer(content)]
+    class_details = [f"class {name}" for name in classes[:SUMMARY_DETAIL_LIMIT]]
+    function_details = [f"{name}()" for name in functions[:SUMMARY_DETAIL_LIMIT]]
+
+    return {
+        "docstring": docstring,
+        "imports": imports,
+        "import_details": import_details,
+        "functions": functions,
+        "function_details": function_details,
+        "classes": classes,
+        "class_details": class_details,
+        "constants": constants,
+        "decorators_used": [],
+        "summary": _build_python_summary(
+            docstring, constants, class_details, function_details, import_details,
+            class_count=len(classes), function_count=len(functions),
+        ),
+        "content_preview": _build_smart_preview(content, docstring),
+    }
+
+
 def extract_module_context(file_path: Path) -> Dict:
     """Extract comprehensive module context for AI analysis."""
     content = _get_file_content(file_path)  # Use cached content
@@ -404,6 +643,9 @@ def extract_module_context(file_path: Path) -> Dict:
     if suffix in (".ts", ".tsx", ".js", ".mjs", ".cjs"):
         return extract_typescript_context(content)
 
+    if len(content) > MAX_AST_PARSE_CHARS:
+        return extract_python_context_regex(content)
+
     docstring = None
     tree = None
 
@@ -440,13 +682,16 @@ def extract_module_context(file_path: Path) -> Dict:
 
             elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
                 func_name = node.name
-                func_doc = ast.get_docstring(node) or ""
-                func_args = [arg.arg for arg in node.args.args[:5]]
                 functions.append(func_name)
 
                 # Get decorators
                 decorators = _get_decorator_names(node)
                 all_decorators.update(decorators)
+                if len(function_details) >= SUMMARY_DETAIL_LIMIT:
+                    continue  # Only counted from here on
+
+                func_doc = ast.get_docstring(node) or ""
+                func_args = [arg.arg for arg in node.args.args[:5]]
                 dec_prefix = f"@{decorators[0]} " if decorators else ""
 
                 # Build signature with return type if available
@@ -459,12 +704,15 @@ def extract_module_context(file_path: Path) -> Dict:
 
             elif isinstance(node, ast.ClassDef):
                 class_name = node.name
-                class_doc = ast.get_docstring(node) or ""
                 classes.append(class_name)
 
                 # Get decorators and bases
                 decorators = _get_decorator_names(node)
                 all_decorators.update(decorators)
+                if len(class_details) >= SUMMARY_DETAIL_LIMIT:
+                    continue  # Only counted from here on
+
+                class_doc = ast.get_docstring(node) or ""
                 bases = _get_base_classes(node)
 
                 # Check for special class types
@@ -510,30 +758,9 @@ def extract_module_context(file_path: Path) -> Dict:
                     if isinstance(target, ast.Name) and target.id.isupper():
                         constants.append(target.id)
 
-    # Build comprehensive summary
-    summary_parts = []
-
-    if docstring:
-        # Include full module docstring (not truncated)
-        summary_parts.append(f"MODULE DOCSTRING:\n{docstring}")
-
-    if constants:
-        summary_parts.append(f"CONSTANTS: {', '.join(constants[:15])}")
-
-    if class_details:
-        summary_parts.append(f"CLASSES ({len(class_details)}):\n" + "\n".join(f"  - {c}" for c in class_details[:8]))
-
-    if function_details:
-        summary_parts.append(f"FUNCTIONS ({len(function_details)}):\n" + "\n".join(f"  - {f}" for f in function_details[:8]))
-
-    if import_details:
-        # Group imports by source
-        core_imports = [i for i in import_details if "core." in i]
-        other_imports = [i for i in import_details if "core." not in i]
-        if core_imports:
-            summary_parts.append(f"STERLING IMPORTS: {', '.join(core_imports[:10])}")
-        if other_imports:
-            summary_parts.append(f"EXTERNAL IMPORTS: {', '.join(other_imports[:8])}")
+        # Drop the AST before building the preview so its nodes don't
+        # count toward peak memory
+        del tree
 
     # Smart content preview - prioritize informative sections
     content_preview = _build_smart_preview(content, docstring)
@@ -548,7 +775,10 @@ def extract_module_context(file_path: Path) -> Dict:
         "class_details": class_details,
         "constants": constants,
         "decorators_used": list(all_decorators),
-        "summary": "\n\n".join(summary_parts),
+        "summary": _build_python_summary(
+            docstring, constants, class_details, function_details, import_details,
+            class_count=len(classes), function_count=len(functions),
+        ),
         "content_preview": content_preview,
     }
 
@@ -617,8 +847,69 @@ else:
     SafeLogitsProcessor = None  # type: ignore
 
 
-def _init_transformers_model(model_path: str = None) -> bool:
-    """Initialize the transformers model for faster generation."""
+def _quantization_config(quantize: str, device):
+    """Build a BitsAndBytesConfig for --quantize, or None to load unquantized."""
+    if quantize == "none":
+        return None
+    if device.type != "cuda":
+        print(f"  --quantize {quantize} needs CUDA (bitsandbytes); loading unquantized. "
+              f"Use --use-ollama for 4-bit models on Apple Silicon")
+        return None
+    try:
+        import bitsandbytes  # noqa: F401
+        from transformers import BitsAndBytesConfig
+    except ImportError:
+        print(f"  bitsandbytes not installed; loading unquantized")
+        return None
+    if quantize == "int4":
+        return BitsAndBytesConfig(
+            load_in_4bit=True,
+            # bf16 matmuls keep fp32's exponent range, so NF4 dequant can't
+            # overflow into inf/NaN logits the way fp16 occasionally does
+            bnb_4bit_compute_dtype=torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16,
+            bnb_4bit_quant_type="nf4",
+        )
+    return BitsAndBytesConfig(load_in_8bit=True)
+
+
+def _attn_implementation(device) -> str:
+    """Fused attention backend: FlashAttention 2 on CUDA when installed, else SDPA."""
+    if device.type == "cuda" and importlib.util.find_spec("flash_attn") is not None:
+        return "flash_attention_2"
+    return "sdpa"
+
+
+def _load_causal_lm(model_path: str, device, **kwargs):
+    """from_pretrained with a fused attention backend, falling back to the
+    model's default attention if the architecture doesn't support it."""
+    attn = _attn_implementation(device)
+    try:
+        model = AutoModelForCausalLM.from_pretrained(model_path, attn_implementation=attn, **kwargs)
+    except (ValueError, ImportError) as e:
+        print(f"  {attn} attention unavailable ({e}); using default attention")
+        return AutoModelForCausalLM.from_pretrained(model_path, **kwargs)
+    print(f"  Attention: {attn}")
+    return model
+
+
+def _init_transformers_model(
+    model_path: str = None,
+    compile_model: bool = False,
+    quantize: str = "none",
+    draft_model_path: Optional[str] = None,
+) -> bool:
+    """Initialize the transformers model for faster generation.
+
+    With compile_model, the model's forward pass is wrapped in torch.compile
+    (CUDA graphs via "reduce-overhead" on CUDA; default mode elsewhere, as MPS
+    support varies). The first batches are slower while graphs are compiled.
+
+    quantize ("int8" or "int4") loads weights through bitsandbytes, which
+    needs CUDA; elsewhere the model loads unquantized.
+
+    draft_model_path loads a smaller model sharing the tokenizer for
+    assisted generation; if it fails to load, generation runs without it.
+    """
     global _GLOBAL_MODEL, _GLOBAL_TOKENIZER, _GLOBAL_DEVICE
 
     if _GLOBAL_MODEL is not None:
@@ -651,13 +942,43 @@ def _init_transformers_model(model_path: str = None) -> bool:
 
         print(f"  Using device: {device}, dtype: {dtype}")
 
-        _GLOBAL_TOKENIZER = AutoTokenizer.from_pretrained(model_path)
-        _GLOBAL_MODEL = AutoModelForCausalLM.from_pretrained(
-            model_path,
-            torch_dtype=dtype,
-        ).to(device)
+        # The Rust-backed tokenizer encodes a whole window in one call
+        _GLOBAL_TOKENIZER = AutoTokenizer.from_pretrained(model_path, use_fast=True)
+        if not _GLOBAL_TOKENIZER.is_fast:
+            print("  No fast tokenizer for this model; prompt tokenization will be slow")
+        # Decoder-only batches must be left-padded so every row's generated
+        # tokens start at the same column
+        _GLOBAL_TOKENIZER.padding_side = "left"
+        if _GLOBAL_TOKENIZER.pad_token is None:
+            _GLOBAL_TOKENIZER.pad_token = _GLOBAL_TOKENIZER.eos_token
+        quantization_config = _quantization_config(quantize, device)
+        if quantization_config is not None:
+            # bitsandbytes models are placed at load time and can't be .to()'d
+            _GLOBAL_MODEL = _load_causal_lm(
+                model_path,
+                device,
+                torch_dtype=dtype,
+                quantization_config=quantization_config,
+                device_map={"": device.index or 0},
+            )
+            print(f"  Quantized weights to {quantize}")
+        else:
+            _GLOBAL_MODEL = _load_causal_lm(model_path, device, torch_dtype=dtype).to(device)
         _GLOBAL_DEVICE = device
 
+        if compile_model:
+            try:
+                mode = "reduce-overhead" if device.type == "cuda" else "default"
+                # Compile forward rather than the module: generate() calls
+                # self.forward, which a compiled wrapper module would bypass
+                _GLOBAL_MODEL.forward = torch.compile(_GLOBAL_MODEL.forward, mode=mode, fullgraph=False)
+                print(f"  Compiled model forward (mode={mode})")
+            except Exception as e:
+                print(f"  torch.compile unavailable ({e}); running eagerly")
+
+        if draft_model_path:
+            _init_draft_model(draft_model_path, device, dtype)
+
         print(f"  Model loaded successfully")
         return True
 
@@ -666,45 +987,160 @@ def _init_transformers_model(model_path: str = None) -> bool:
         return False
 
 
-def _apply_chat_template(prompts: List[str], system_prompts: Optional[List[str]] = None) -> List[str]:
-    """Apply chat template to prompts.
+def _init_draft_model(draft_model_path: str, device, dtype) -> None:
+    """Load the draft model for assisted generation, or leave it unset."""
+    global _GLOBAL_DRAFT_MODEL
+
+    try:
+        _GLOBAL_DRAFT_MODEL = _load_causal_lm(draft_model_path, device, torch_dtype=dtype).to(device)
+        print(f"  Loaded draft model from {draft_model_path}")
+    except Exception as e:
+        _GLOBAL_DRAFT_MODEL = None
+        print(f"  Draft model unavailable ({e}); generating without it")
+
+
+def _assistant_kwargs(rows: int) -> Dict:
+    """generate() kwargs for assisted decoding, which only supports one row."""
+    if _GLOBAL_DRAFT_MODEL is None or rows != 1:
+        return {}
+    return {"assistant_model": _GLOBAL_DRAFT_MODEL}
+
+
+def _render_chat_prompt(prompt: str, system: Optional[str] = None) -> str:
+    """Render one prompt (and optional system prompt) with the chat template.
 
     Uses the tokenizer's chat template if available, otherwise falls back to
     a standard format compatible with Olmo.
     """
-    global _GLOBAL_TOKENIZER
+    messages = []
+    if system:
+        messages.append({"role": "system", "content": system})
+    messages.append({"role": "user", "content": prompt})
 
-    formatted = []
-    for i, prompt in enumerate(prompts):
-        system = system_prompts[i] if system_prompts and i < len(system_prompts) else None
+    if hasattr(_GLOBAL_TOKENIZER, 'apply_chat_template'):
+        try:
+            return _GLOBAL_TOKENIZER.apply_chat_template(
+                messages,
+                tokenize=False,
+                add_generation_prompt=True
+            )
+        except Exception:
+            pass
 
-        messages = []
-        if system:
-            messages.append({"role": "system", "content": system})
-        messages.append({"role": "user", "content": prompt})
+    # Fallback format for Olmo-style models
+    if system:
+        return f"<|im_start|>system\n{system}<|im_end|>\n<|im_start|>user\n{prompt}<|im_end|>\n<|im_start|>assistant\n"
+    return f"<|im_start|>user\n{prompt}<|im_end|>\n<|im_start|>assistant\n"
 
-        if hasattr(_GLOBAL_TOKENIZER, 'apply_chat_template'):
-            try:
-                full_prompt = _GLOBAL_TOKENIZER.apply_chat_template(
-                    messages,
-                    tokenize=False,
-                    add_generation_prompt=True
-                )
-            except Exception:
-                # Fallback format for Olmo-style models
-                if system:
-                    full_prompt = f"<|im_start|>system\n{system}<|im_end|>\n<|im_start|>user\n{prompt}<|im_end|>\n<|im_start|>assistant\n"
-                else:
-                    full_prompt = f"<|im_start|>user\n{prompt}<|im_end|>\n<|im_start|>assistant\n"
-        else:
-            # Fallback format
-            if system:
-                full_prompt = f"<|im_start|>system\n{system}<|im_end|>\n<|im_start|>user\n{prompt}<|im_end|>\n<|im_start|>assistant\n"
-            else:
-                full_prompt = f"<|im_start|>user\n{prompt}<|im_end|>\n<|im_start|>assistant\n"
 
-        formatted.append(full_prompt)
-    return formatted
+def _apply_chat_template(prompts: List[str], system_prompts: Optional[List[str]] = None) -> List[str]:
+    """Apply chat template to prompts.
+
+    All conversations go through one batched apply_chat_template call;
+    if that fails each prompt is rendered on its own (with the fallback
+    format where the tokenizer has no template).
+    """
+    systems = [
+        system_prompts[i] if system_prompts and i < len(system_prompts) else None
+        for i in range(len(prompts))
+    ]
+    if prompts and hasattr(_GLOBAL_TOKENIZER, 'apply_chat_template'):
+        conversations = [
+            ([{"role": "system", "content": system}] if system else [])
+            + [{"role": "user", "content": prompt}]
+            for prompt, system in zip(prompts, systems)
+        ]
+        try:
+            rendered = _GLOBAL_TOKENIZER.apply_chat_template(
+                conversations,
+                tokenize=False,
+                add_generation_prompt=True
+            )
+            if isinstance(rendered, list) and len(rendered) == len(prompts):
+                return rendered
+        except Exception:
+            pass
+    return [_render_chat_prompt(prompt, system) for prompt, system in zip(prompts, systems)]
+
+
+# Longest prompt (in tokens) passed to generate(); longer prompts are cut
+MAX_PROMPT_TOKENS = 4096
+
+# Marks where the user message goes when rendering a template skeleton
+_CHAT_SENTINEL = "\x00USER_CONTENT\x00"
+# system prompt -> (template tail, token ids of template head), or None when
+# the template can't be split around the user message without changing tokens
+_CHAT_PREFIX_CACHE: Dict[Optional[str], Optional[Tuple[str, List[int]]]] = {}
+
+
+def _chat_prefix(system: Optional[str], sample_prompt: str) -> Optional[Tuple[str, List[int]]]:
+    """Split the rendered template for system around the user message.
+
+    The head (system turn and the opening of the user turn) is tokenized once
+    per system prompt. The split is checked against a full render and
+    tokenization of sample_prompt, and is rejected (None) if the template
+    alters the message or the tokens differ at the seams.
+    """
+    if system in _CHAT_PREFIX_CACHE:
+        return _CHAT_PREFIX_CACHE[system]
+
+    prefix = None
+    parts = _render_chat_prompt(_CHAT_SENTINEL, system).split(_CHAT_SENTINEL)
+    if len(parts) == 2:
+        head, tail = parts
+        full = _render_chat_prompt(sample_prompt, system)
+        if full == head + sample_prompt + tail:
+            head_ids = _GLOBAL_TOKENIZER(head)["input_ids"]
+            rest_ids = _GLOBAL_TOKENIZER(sample_prompt + tail, add_special_tokens=False)["input_ids"]
+            if head_ids + rest_ids == _GLOBAL_TOKENIZER(full)["input_ids"]:
+                prefix = (tail, head_ids)
+
+    _CHAT_PREFIX_CACHE[system] = prefix
+    return prefix
+
+
+def _encode_chat_prompts(
+    prompts: List[str], system_prompts: Optional[List[str]] = None
+) -> Dict[str, List[List[int]]]:
+    """Tokenize chat prompts, reusing each system prompt's template tokens.
+
+    Only the user message and the short template tail are tokenized per
+    prompt; the cached head ids are prepended. Prompts whose template can't
+    be split safely are rendered and tokenized in full (prefix length 0).
+    Every prompt is cut to MAX_PROMPT_TOKENS.
+    """
+    systems = [
+        system_prompts[i] if system_prompts and i < len(system_prompts) else None
+        for i in range(len(prompts))
+    ]
+    prefixes = [_chat_prefix(system, prompt) for system, prompt in zip(systems, prompts)]
+    input_ids: List[Optional[List[int]]] = [None] * len(prompts)
+    prefix_lengths = [0] * len(prompts)
+
+    split_rows = [i for i, prefix in enumerate(prefixes) if prefix is not None]
+    if split_rows:
+        encoded = _GLOBAL_TOKENIZER(
+            [prompts[i] + prefixes[i][0] for i in split_rows], add_special_tokens=False
+        )
+        for i, ids in zip(split_rows, encoded["input_ids"]):
+            input_ids[i] = (prefixes[i][1] + ids)[:MAX_PROMPT_TOKENS]
+            prefix_lengths[i] = len(prefixes[i][1])
+
+    full_rows = [i for i, prefix in enumerate(prefixes) if prefix is None]
+    if full_rows:
+        encoded = _GLOBAL_TOKENIZER(
+            _apply_chat_template([prompts[i] for i in full_rows], [systems[i] for i in full_rows]),
+            truncation=True,
+            max_length=MAX_PROMPT_TOKENS,
+        )
+        for i, ids in zip(full_rows, encoded["input_ids"]):
+            input_ids[i] = ids
+
+    return {
+        "input_ids": input_ids,
+        "attention_mask": [[1] * len(ids) for ids in input_ids],
+        "prefix_lengths": prefix_lengths,  # Template-head tokens at the start of each row
+    }
 
 
 def _clear_gpu_cache():
@@ -716,112 +1152,416 @@ def _clear_gpu_cache():
             torch.cuda.empty_cache()
 
 
-def _generate_with_transformers(prompt: str, system_prompt: str, max_new_tokens: int = 256) -> Optional[str]:
+# Descriptions are one to three sentences; rows that hit an end-of-turn token
+# stop early, so this is only the ceiling for a rambling row
+DEFAULT_MAX_NEW_TOKENS = 128
+
+
+# Greedy decoding unless --sample: descriptions don't benefit from variety,
+# greedy skips the per-step top-p sort and logits processor, and identical
+# inputs give identical (cacheable) descriptions
+_SAMPLE_DESCRIPTIONS = False
+
+
+def _decoding_kwargs() -> Dict:
+    """generate() kwargs for greedy decoding, or for sampling with --sample."""
+    if not _SAMPLE_DESCRIPTIONS:
+        return {"do_sample": False, "num_beams": 1}
+    kwargs = {"do_sample": True, "temperature": 0.7, "top_p": 0.9}
+    if SafeLogitsProcessor:
+        # Clamp logits for numerical stability while sampling
+        kwargs["logits_processor"] = [SafeLogitsProcessor()]
+    return kwargs
+
+
+def _stop_token_ids() -> List[int]:
+    """Token ids that end a completion: EOS plus the chat end-of-turn marker.
+
+    generate() marks each row finished when it emits one of these and stops
+    once every row in the batch is done, instead of running all rows to
+    max_new_tokens.
+    """
+    stop_ids = [_GLOBAL_TOKENIZER.eos_token_id]
+    im_end = _GLOBAL_TOKENIZER.convert_tokens_to_ids("<|im_end|>")
+    if im_end is not None and im_end != _GLOBAL_TOKENIZER.unk_token_id and im_end not in stop_ids:
+        stop_ids.append(im_end)
+    return stop_ids
+
+
+def _generate_with_transformers(
+    prompt: str, system_prompt: str, max_new_tokens: int = DEFAULT_MAX_NEW_TOKENS
+) -> Optional[str]:
     """Generate text using the loaded transformers model."""
     results = _generate_batch_with_transformers([(prompt, system_prompt)], max_new_tokens)
     return results[0] if results else None
 
 
+# Padded prompt tokens allowed in one generate() call (rows x longest prompt)
+DEFAULT_MAX_BATCH_TOKENS = 8192
+
+
+def _plan_length_batches(lengths: List[int], batch_size: int, max_batch_tokens: int) -> List[List[int]]:
+    """Group prompt indices into batches of similar token length.
+
+    Prompts are sorted by length and packed greedily until either the row
+    limit or the padded-token budget would be exceeded, so one long prompt
+    no longer forces padding (and decode steps) onto several short ones.
+    A prompt longer than the whole budget gets a batch of its own.
+    """
+    batches: List[List[int]] = []
+    current: List[int] = []
+    for i in sorted(range(len(lengths)), key=lengths.__getitem__):
+        # Sorted ascending, so lengths[i] is the padded length if i joins
+        if current and (len(current) >= batch_size or lengths[i] * (len(current) + 1) > max_batch_tokens):
+            batches.append(current)
+            current = []
+        current.append(i)
+    if current:
+        batches.append(current)
+    return batches
+
+
+# Prefilled KV caches of shared prompt prefixes (the system turn), keyed by
+# prefix token ids; disabled for the run if prefix reuse ever fails
+_PREFIX_KV_CACHE: Dict[Tuple[int, ...], object] = {}
+_PREFIX_CACHE_ENABLED = True
+_PREFIX_CACHE_VERIFIED = False
+
+# Greedy tokens compared when checking prefix reuse against a full prefill
+_PREFIX_CHECK_TOKENS = 16
+
+
+def _disable_prefix_cache(error: Exception) -> None:
+    """Turn off prefix KV reuse after a failure and drop the cached prefills."""
+    global _PREFIX_CACHE_ENABLED
+    print(f"  Prefix KV cache disabled ({error}); prefilling full prompts")
+    _PREFIX_CACHE_ENABLED = False
+    _PREFIX_KV_CACHE.clear()
+
+
+def _shared_prefix_length(encoded: Dict[str, List[List[int]]], batch: List[int]) -> int:
+    """Length of the cached template head shared by every row in batch, or 0."""
+    if not _PREFIX_CACHE_ENABLED or _GLOBAL_DRAFT_MODEL is not None:
+        return 0
+    lengths = {encoded["prefix_lengths"][i] for i in batch}
+    if len(lengths) != 1:
+        return 0
+    prefix_len = lengths.pop()
+    first = encoded["input_ids"][batch[0]]
+    if not prefix_len or any(
+        len(encoded["input_ids"][i]) <= prefix_len or encoded["input_ids"][i][:prefix_len] != first[:prefix_len]
+        for i in batch
+    ):
+        return 0
+    return prefix_len
+
+
+def _prefix_past_key_values(prefix_ids: List[int], rows: int):
+    """Fresh copy of the prefilled KV cache for prefix_ids, repeated for rows.
+
+    The prefix is run through the model once per run; generate() extends the
+    cache it is given, so every call gets its own copy.
+    """
+    key = tuple(prefix_ids)
+    cache = _PREFIX_KV_CACHE.get(key)
+    if cache is None:
+        with torch.inference_mode():
+            cache = _GLOBAL_MODEL(
+                input_ids=torch.tensor([prefix_ids], device=_GLOBAL_DEVICE),
+                use_cache=True,
+            ).past_key_values
+        if not hasattr(cache, "batch_repeat_interleave"):
+            raise RuntimeError("model returned a legacy tuple KV cache")
+        _PREFIX_KV_CACHE[key] = cache
+    past = copy.deepcopy(cache)
+    if rows > 1:
+        past.batch_repeat_interleave(rows)
+    return past
+
+
+# Device-side input buffers reused by every batch; each batch takes a
+# contiguous (rows, length) view, so steady-state batches allocate nothing
+_INPUT_BUFFERS: Dict[str, object] = {}
+
+
+def _pooled_inputs(inputs: Dict) -> Dict:
+    """Copy padded CPU inputs into the reusable device buffers."""
+    rows, length = inputs["input_ids"].shape
+    pooled = {}
+    for key, src in inputs.items():
+        buf = _INPUT_BUFFERS.get(key)
+        if buf is None or buf.numel() < rows * length:
+            # Grow to the largest batch seen so far, never shrink
+            buf = torch.empty(max(rows * length, rows * MAX_PROMPT_TOKENS), dtype=src.dtype, device=_GLOBAL_DEVICE)
+            _INPUT_BUFFERS[key] = buf
+        view = buf[: rows * length].view(rows, length)
+        if _GLOBAL_DEVICE.type == "cuda":
+            # Async only from pinned memory; the pinned copy stays alive until
+            # the stream reaches it because the caching host allocator holds it
+            view.copy_(src.pin_memory(), non_blocking=True)
+        else:
+            # MPS/CPU: a non-blocking copy could still be reading src after
+            # it is freed
+            view.copy_(src)
+        pooled[key] = view
+    return pooled
+
+
+def _pad_batch(encoded: Dict[str, List[List[int]]], batch: List[int], prefix_len: int = 0):
+    """Pad a batch of pre-tokenized prompts; returns (inputs, prompt_length).
+
+    Rows are left-padded (padding_side is set at load time). With prefix_len,
+    the shared prefix is kept at columns [0, prefix_len) of every row and the
+    padding goes between it and the per-row suffix, so the prefix lines up
+    with its cached KV; the attention mask zeroes the pad columns.
+    """
+    inputs = _GLOBAL_TOKENIZER.pad(
+        {
+            "input_ids": [encoded["input_ids"][i][prefix_len:] for i in batch],
+            "attention_mask": [encoded["attention_mask"][i][prefix_len:] for i in batch],
+        },
+        padding=True,
+        return_tensors="pt",
+    )
+    inputs = {"input_ids": inputs["input_ids"], "attention_mask": inputs["attention_mask"]}
+    if prefix_len:
+        rows = len(batch)
+        prefix = torch.tensor([encoded["input_ids"][batch[0]][:prefix_len]]).expand(rows, -1)
+        ones = torch.ones(rows, prefix_len, dtype=inputs["attention_mask"].dtype)
+        inputs = {
+            "input_ids": torch.cat([prefix, inputs["input_ids"]], dim=1),
+            "attention_mask": torch.cat([ones, inputs["attention_mask"]], dim=1),
+        }
+    inputs = _pooled_inputs(inputs)
+    # With left padding every row's completion starts at the same column
+    return inputs, inputs["input_ids"].shape[1]
+
+
+def _verify_prefix_cache(encoded: Dict[str, List[List[int]]], batch: List[int], prefix_len: int) -> None:
+    """Check once per run that prefix reuse reproduces a full prefill.
+
+    The pad columns between the prefix and the suffixes shift cache positions
+    relative to an unpadded prompt; how a model derives its positions (from
+    the attention mask or from the cache length) decides whether that is
+    harmless. A short greedy run of the batch with and without the cached
+    prefix settles it for the loaded model; raises if the outputs differ.
+    """
+    global _PREFIX_CACHE_VERIFIED
+    if _PREFIX_CACHE_VERIFIED:
+        return
+    prefix_ids = encoded["input_ids"][batch[0]][:prefix_len]
+    greedy = {
+        "max_new_tokens": _PREFIX_CHECK_TOKENS,
+        "do_sample": False,
+        "pad_token_id": _GLOBAL_TOKENIZER.eos_token_id,
+        "eos_token_id": _stop_token_ids(),
+        "use_cache": True,
+    }
+    completions = []
+    for cached in (True, False):
+        inputs, prompt_length = _pad_batch(encoded, batch, prefix_len if cached else 0)
+        past = {"past_key_values": _prefix_past_key_values(prefix_ids, len(batch))} if cached else {}
+        with torch.inference_mode():
+            outputs = _GLOBAL_MODEL.generate(**inputs, **greedy, **past)
+        completions.append(outputs[:, prompt_length:].tolist())
+    if completions[0] != completions[1]:
+        raise RuntimeError("cached prefix output differs from full prefill")
+    _PREFIX_CACHE_VERIFIED = True
+
+
+def _generate_padded(inputs: Dict, max_new_tokens: int, rows: int, prefix_ids: Optional[List[int]] = None):
+    """Run generate() on a padded batch, sampling with a greedy fallback.
+
+    With prefix_ids, generation resumes from the prefix's cached KV instead
+    of prefilling it again.
+    """
+    stop_ids = _stop_token_ids()
+
+    def past_kwargs():
+        if prefix_ids is None:
+            return {}
+        return {"past_key_values": _prefix_past_key_values(prefix_ids, rows)}
+
+    with torch.inference_mode():
+        try:
+            generate_kwargs = {
+                "max_new_tokens": max_new_tokens,
+                "pad_token_id": _GLOBAL_TOKENIZER.eos_token_id,
+                "eos_token_id": stop_ids,
+                "use_cache": True,
+            }
+            generate_kwargs.update(_decoding_kwargs())
+            generate_kwargs.update(_assistant_kwargs(rows))
+
+            return _GLOBAL_MODEL.generate(**inputs, **generate_kwargs, **past_kwargs())
+        except RuntimeError as e:
+            error_msg = str(e).lower()
+            if _SAMPLE_DESCRIPTIONS and ("probability" in error_msg or "inf" in error_msg or "nan" in error_msg):
+                # Fallback to greedy decoding if sampling fails
+                print(f"  Warning: Sampling failed ({e}), falling back to greedy decoding")
+                return _GLOBAL_MODEL.generate(
+                    **inputs,
+                    max_new_tokens=max_new_tokens,
+                    do_sample=False,
+                    pad_token_id=_GLOBAL_TOKENIZER.eos_token_id,
+                    eos_token_id=stop_ids,
+                    use_cache=True,
+                    **past_kwargs(),
+                )
+            raise
+
+
 def _generate_batch_with_transformers(
     prompt_pairs: List[Tuple[str, str]],  # List of (prompt, system_prompt)
-    max_new_tokens: int = 256,
+    max_new_tokens: int = DEFAULT_MAX_NEW_TOKENS,
     batch_size: int = 4,
+    max_batch_tokens: int = DEFAULT_MAX_BATCH_TOKENS,
 ) -> List[Optional[str]]:
     """Generate text for multiple prompts in batches for efficiency.
 
-    This method processes prompts in smaller batches to avoid OOM errors
-    while still benefiting from batched inference.
+    Prompts are grouped into length-homogeneous batches (see
+    _plan_length_batches) capped by batch_size rows and max_batch_tokens
+    padded tokens, to avoid OOM errors while still benefiting from batched
+    inference. Results are returned in the order of prompt_pairs.
     """
     global _GLOBAL_MODEL, _GLOBAL_TOKENIZER, _GLOBAL_DEVICE
 
     if _GLOBAL_MODEL is None or not prompt_pairs:
         return [None] * len(prompt_pairs)
 
-    results = []
+    results: List[Optional[str]] = [None] * len(prompt_pairs)
 
-    # Process in batches
-    for batch_start in range(0, len(prompt_pairs), batch_size):
-        batch_end = min(batch_start + batch_size, len(prompt_pairs))
-        batch = prompt_pairs[batch_start:batch_end]
+    # Format and tokenize every prompt once up front; each batch below only
+    # has to be padded to its own longest prompt
+    try:
+        encoded = _encode_chat_prompts(
+            [p[0] for p in prompt_pairs],
+            [p[1] for p in prompt_pairs],
+        )
+        batches = _plan_length_batches(
+            [len(ids) for ids in encoded["input_ids"]], batch_size, max_batch_tokens
+        )
+    except Exception as e:
+        print(f"  Batch tokenization error: {e}")
+        encoded = None
+        batches = [
+            list(range(start, min(start + batch_size, len(prompt_pairs))))
+            for start in range(0, len(prompt_pairs), batch_size)
+        ]
 
+    for batch in batches:
         try:
-            # Format all prompts using chat template
-            prompts = [p[0] for p in batch]
-            system_prompts = [p[1] for p in batch]
-            full_prompts = _apply_chat_template(prompts, system_prompts)
-
-            # Tokenize batch with padding
-            inputs = _GLOBAL_TOKENIZER(
-                full_prompts,
-                return_tensors="pt",
-                truncation=True,
-                max_length=4096,
-                padding=True,
-            ).to(_GLOBAL_DEVICE)
-
-            input_lengths = [
-                (inputs.attention_mask[i] == 1).sum().item()
-                for i in range(len(batch))
-            ]
+            if encoded is None:
+                raise RuntimeError("prompts could not be tokenized as a batch")
 
-            # Create logits processor for numerical stability
-            logits_processor = [SafeLogitsProcessor()] if SafeLogitsProcessor else None
-
-            with torch.no_grad():
+            outputs = None
+            prefix_len = _shared_prefix_length(encoded, batch)
+            if prefix_len:
                 try:
-                    # Try sampling first with logits processor
-                    generate_kwargs = {
-                        "max_new_tokens": max_new_tokens,
-                        "do_sample": True,
-                        "temperature": 0.7,
-                        "top_p": 0.9,
-                        "pad_token_id": _GLOBAL_TOKENIZER.eos_token_id,
-                    }
-                    if logits_processor:
-                        generate_kwargs["logits_processor"] = logits_processor
-
-                    outputs = _GLOBAL_MODEL.generate(**inputs, **generate_kwargs)
-                except RuntimeError as e:
-                    error_msg = str(e).lower()
-                    if "probability" in error_msg or "inf" in error_msg or "nan" in error_msg:
-                        # Fallback to greedy decoding if sampling fails
-                        print(f"  Warning: Sampling failed ({e}), falling back to greedy decoding")
-                        outputs = _GLOBAL_MODEL.generate(
-                            **inputs,
-                            max_new_tokens=max_new_tokens,
-                            do_sample=False,
-                            pad_token_id=_GLOBAL_TOKENIZER.eos_token_id,
-                        )
-                    else:
-                        raise
-
-            # Decode each response
-            for i, output in enumerate(outputs):
+                    _verify_prefix_cache(encoded, batch, prefix_len)
+                    inputs, prompt_length = _pad_batch(encoded, batch, prefix_len)
+                    prefix_ids = encoded["input_ids"][batch[0]][:prefix_len]
+                    outputs = _generate_padded(inputs, max_new_tokens, len(batch), prefix_ids)
+                except Exception as e:
+                    _disable_prefix_cache(e)
+            if outputs is None:
+                inputs, prompt_length = _pad_batch(encoded, batch)
+                outputs = _generate_padded(inputs, max_new_tokens, len(batch))
+
+            # Decode each response back into its original slot
+            for i, output in zip(batch, outputs):
                 response = _GLOBAL_TOKENIZER.decode(
-                    output[input_lengths[i]:],
+                    output[prompt_length:],
                     skip_special_tokens=True
                 )
-                results.append(response.strip())
-
-            # Clear GPU memory periodically
-            del inputs, outputs
-            _clear_gpu_cache()
+                results[i] = response.strip()
 
         except Exception as e:
             print(f"  Batch generation error: {e}")
+            _clear_gpu_cache()  # Release what the failed batch held (e.g. after OOM)
             # Fall back to individual generation for this batch
-            for prompt, system_prompt in batch:
+            for i in batch:
+                prompt, system_prompt = prompt_pairs[i]
                 try:
-                    result = _generate_single_with_transformers(prompt, system_prompt, max_new_tokens)
-                    results.append(result)
+                    results[i] = _generate_single_with_transformers(prompt, system_prompt, max_new_tokens)
                 except Exception as inner_e:
                     print(f"  Single generation also failed: {inner_e}")
-                    results.append(None)
+                    results[i] = None
 
     return results
 
 
-def _generate_single_with_transformers(prompt: str, system_prompt: str, max_new_tokens: int = 256) -> Optional[str]:
+def _init_vllm_engine(model_path: str = None) -> bool:
+    """Initialize a vLLM engine (continuous batching, automatic prefix caching).
+
+    vLLM is imported lazily since it is optional and slow to import; returns
+    False if it is missing or the engine can't start (e.g. no CUDA), so the
+    caller can fall back to transformers.
+    """
+    global _GLOBAL_VLLM, _GLOBAL_TOKENIZER
+
+    if _GLOBAL_VLLM is not None:
+        return True
+
+    if model_path is None:
+        model_path = DEFAULT_MODEL_PATH
+
+    try:
+        from vllm import LLM
+    except ImportError:
+        print("  vLLM not installed; using transformers")
+        return False
+
+    try:
+        print(f"  Loading vLLM engine from {model_path}...")
+        _GLOBAL_VLLM = LLM(model=model_path, enable_prefix_caching=True)
+        # Shared chat-template and stop-token helpers use the global tokenizer
+        _GLOBAL_TOKENIZER = _GLOBAL_VLLM.get_tokenizer()
+        print(f"  vLLM engine loaded successfully")
+        return True
+    except Exception as e:
+        _GLOBAL_VLLM = None
+        print(f"  Failed to start vLLM engine: {e}")
+        return False
+
+
+def _generate_batch_with_vllm(
+    prompt_pairs: List[Tuple[str, str]],  # List of (prompt, system_prompt)
+    max_new_tokens: int = DEFAULT_MAX_NEW_TOKENS,
+) -> List[Optional[str]]:
+    """Generate text for all prompts in one vLLM call.
+
+    vLLM schedules the requests itself: finished sequences free their slot
+    for waiting prompts every step, and the shared system-prompt prefix is
+    cached once. Results are returned in the order of prompt_pairs.
+    """
+    from vllm import SamplingParams
+
+    if _GLOBAL_VLLM is None or not prompt_pairs:
+        return [None] * len(prompt_pairs)
+
+    params = SamplingParams(
+        # temperature 0 is greedy in vLLM
+        temperature=0.7 if _SAMPLE_DESCRIPTIONS else 0.0,
+        top_p=0.9 if _SAMPLE_DESCRIPTIONS else 1.0,
+        max_tokens=max_new_tokens,
+        stop_token_ids=_stop_token_ids(),
+    )
+    try:
+        full_prompts = _apply_chat_template(
+            [p[0] for p in prompt_pairs],
+            [p[1] for p in prompt_pairs],
+        )
+        outputs = _GLOBAL_VLLM.generate(full_prompts, params, use_tqdm=False)
+    except Exception as e:
+        print(f"  vLLM generation error: {e}")
+        return [None] * len(prompt_pairs)
+    return [out.outputs[0].text.strip() if out.outputs else None for out in outputs]
+
+
+def _generate_single_with_transformers(
+    prompt: str, system_prompt: str, max_new_tokens: int = DEFAULT_MAX_NEW_TOKENS
+) -> Optional[str]:
     """Generate text for a single prompt (fallback for batch failures)."""
     global _GLOBAL_MODEL, _GLOBAL_TOKENIZER, _GLOBAL_DEVICE
 
@@ -829,56 +1569,15 @@ def _generate_single_with_transformers(prompt: str, system_prompt: str, max_new_
         return None
 
     try:
-        # Use the shared chat template function
-        system_prompts_list = [system_prompt] if system_prompt else None
-        full_prompts = _apply_chat_template([prompt], system_prompts_list)
-        full_prompt = full_prompts[0]
-
-        inputs = _GLOBAL_TOKENIZER(
-            full_prompt,
-            return_tensors="pt",
-            truncation=True,
-            max_length=4096,
-        ).to(_GLOBAL_DEVICE)
-
-        # Create logits processor for numerical stability
-        logits_processor = [SafeLogitsProcessor()] if SafeLogitsProcessor else None
-
-        with torch.no_grad():
-            try:
-                generate_kwargs = {
-                    "max_new_tokens": max_new_tokens,
-                    "do_sample": True,
-                    "temperature": 0.7,
-                    "top_p": 0.9,
-                    "pad_token_id": _GLOBAL_TOKENIZER.eos_token_id,
-                }
-                if logits_processor:
-                    generate_kwargs["logits_processor"] = logits_processor
-
-                outputs = _GLOBAL_MODEL.generate(**inputs, **generate_kwargs)
-            except RuntimeError as e:
-                error_msg = str(e).lower()
-                if "probability" in error_msg or "inf" in error_msg or "nan" in error_msg:
-                    # Fallback to greedy decoding
-                    outputs = _GLOBAL_MODEL.generate(
-                        **inputs,
-                        max_new_tokens=max_new_tokens,
-                        do_sample=False,
-                        pad_token_id=_GLOBAL_TOKENIZER.eos_token_id,
-                    )
-                else:
-                    raise
+        # Same encoding and generate() path as a batch, with one row
+        encoded = _encode_chat_prompts([prompt], [system_prompt] if system_prompt else None)
+        inputs, prompt_length = _pad_batch(encoded, [0])
+        outputs = _generate_padded(inputs, max_new_tokens, 1)
 
         response = _GLOBAL_TOKENIZER.decode(
-            outputs[0][inputs.input_ids.shape[1]:],
+            outputs[0][prompt_length:],
             skip_special_tokens=True
         )
-
-        # Clean up
-        del inputs, outputs
-        _clear_gpu_cache()
-
         return response.strip()
 
     except Exception as e:
@@ -886,8 +1585,54 @@ def _generate_single_with_transformers(prompt: str, system_prompt: str, max_new_
         return None
 
 
+def _ollama_base_url() -> str:
+    """Ollama server URL, honouring OLLAMA_HOST like the ollama CLI does."""
+    host = os.environ.get("OLLAMA_HOST", "127.0.0.1:11434")
+    return host if "://" in host else f"http://{host}"
+
+
+# Concurrent requests sent to the Ollama server; match the server's
+# OLLAMA_NUM_PARALLEL so requests overlap instead of queueing
+OLLAMA_NUM_PARALLEL = int(os.environ.get("OLLAMA_NUM_PARALLEL", 4))
+
+
+def _call_ollama_http(prompt: str, system_prompt: str, model: str, timeout: int) -> Optional[str]:
+    """Generate through the Ollama server's /api/generate endpoint.
+
+    Returns the raw response text; raises urllib.error.URLError if the server
+    can't be reached or rejects the request.
+    """
+    body = json.dumps({
+        "model": model,
+        "prompt": f"{system_prompt}\n\n{prompt}",
+        "stream": False,
+        # Greedy unless --sample, matching the transformers path
+        "options": {} if _SAMPLE_DESCRIPTIONS else {"temperature": 0},
+    }).encode("utf-8")
+    request = urllib.request.Request(
+        f"{_ollama_base_url()}/api/generate",
+        data=body,
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read()).get("response", "").strip()
+
+
 def call_ollama(prompt: str, system_prompt: str, model: str = "llama3.2:latest", timeout: int = 180) -> Optional[str]:
-    """Call ollama with specified model (fallback if transformers unavailable)."""
+    """Call ollama with specified model (fallback if transformers unavailable).
+
+    Talks to the Ollama server over HTTP, which avoids a process launch per
+    prompt and lets calls run concurrently; falls back to `ollama run` if
+    the request fails (e.g. the model still needs pulling).
+    """
+    try:
+        return _parse_llm_response(_call_ollama_http(prompt, system_prompt, model, timeout))
+    except TimeoutError:
+        print("  Timeout calling ollama")
+        return None
+    except (urllib.error.URLError, OSError, ValueError):
+        pass
+
     try:
         result = subprocess.run(
             ["ollama", "run", model, "--nowordwrap"],
@@ -914,6 +1659,18 @@ def call_ollama(prompt: str, system_prompt: str, model: str = "llama3.2:latest",
         return None
 
 
+def call_ollama_many(
+    prompt_pairs: List[Tuple[str, str]],  # List of (prompt, system_prompt)
+    model: str = "llama3.2:latest",
+    max_workers: int = OLLAMA_NUM_PARALLEL,
+) -> List[Optional[str]]:
+    """call_ollama over many prompts concurrently; results keep input order."""
+    if len(prompt_pairs) <= 1 or max_workers <= 1:
+        return [call_ollama(prompt, system_prompt, model=model) for prompt, system_prompt in prompt_pairs]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda pair: call_ollama(pair[0], pair[1], model=model), prompt_pairs))
+
+
 def generate_text(prompt: str, system_prompt: str, use_transformers: bool = True, model: str = "llama3.2:latest") -> Optional[str]:
     """Generate text using the best available method."""
     # Try transformers first if available and requested
@@ -927,6 +1684,20 @@ def generate_text(prompt: str, system_prompt: str, use_transformers: bool = True
     return call_ollama(prompt, system_prompt, model=model)
 
 
+# Patterns that indicate meta-commentary (not the actual content)
+META_COMMENTARY_PATTERNS = (
+    "let me", "i'll", "i will", "thinking", "hmm", "okay so", "alright",
+    "let's see", "i need to", "first,", "now,", "...done thinking",
+    "putting it together", "final answer", "here is", "so the",
+    "maybe", "that seems", "i think", "```", "---",
+    "looking at", "based on", "the module", "the script", "the file",
+    "this module", "let me generate", "generating",
+)
+META_COMMENTARY_RE = re.compile(
+    "|".join(re.escape(p) for p in META_COMMENTARY_PATTERNS), re.IGNORECASE
+)
+
+
 def _filter_meta_commentary(response: str) -> str:
     """Filter out thinking/meta-commentary from LLM responses.
 
@@ -940,21 +1711,9 @@ def _filter_meta_commentary(response: str) -> str:
     filtered_lines = []
     in_output_block = False
 
-    # Patterns that indicate meta-commentary (not the actual content)
-    skip_patterns = [
-        "let me", "i'll", "i will", "thinking", "hmm", "okay so", "alright",
-        "let's see", "i need to", "first,", "now,", "...done thinking",
-        "putting it together", "final answer", "here is", "so the",
-        "maybe", "that seems", "i think", "```", "---",
-        "looking at", "based on", "the module", "the script", "the file",
-        "this module", "let me generate", "generating",
-    ]
-
     for line in lines:
-        lower_line = line.lower().strip()
-
         # Skip obvious meta-commentary (unless we're in an output block)
-        if any(p in lower_line for p in skip_patterns) and not in_output_block:
+        if not in_output_block and META_COMMENTARY_RE.search(line):
             continue
 
         # Track output blocks (preserve everything inside them)
@@ -968,6 +1727,10 @@ def _filter_meta_commentary(response: str) -> str:
     return "\n".join(filtered_lines).strip()
 
 
+# Strategy 3 bonus for paragraphs that name what the module does
+TECH_TERM_RE = re.compile(r"implements|provides|defines|handles", re.IGNORECASE)
+
+
 def _parse_llm_response(response: str) -> Optional[str]:
     """Parse LLM response to extract the description.
 
@@ -996,7 +1759,7 @@ def _parse_llm_response(response: str) -> Optional[str]:
             continue
 
         # Check if line starts with action verb
-        starts_with_verb = any(line_stripped.startswith(verb) for verb in ACTION_VERBS)
+        starts_with_verb = line_stripped.startswith(ACTION_VERBS)
 
         if starts_with_verb:
             collecting = True
@@ -1035,9 +1798,9 @@ def _parse_llm_response(response: str) -> Optional[str]:
 
         # Score based on presence of action verbs and technical terms
         score = len(para)
-        if any(para.startswith(verb) for verb in ACTION_VERBS):
+        if para.startswith(ACTION_VERBS):
             score += 200
-        if any(term in para.lower() for term in ["implements", "provides", "defines", "handles"]):
+        if TECH_TERM_RE.search(para):
             score += 100
 
         if score > best_score:
@@ -1047,19 +1810,23 @@ def _parse_llm_response(response: str) -> Optional[str]:
     return best_paragraph
 
 
+SENTENCE_END_RE = re.compile(r'[.!?]\s+')
+
+
 def _truncate_at_sentence(text: str, max_chars: int) -> str:
     """Truncate text at a sentence boundary, not mid-word."""
     if len(text) <= max_chars:
         return text
 
-    # Find sentence boundaries
-    sentence_ends = list(re.finditer(r'[.!?]\s+', text[:max_chars + 50]))
-
-    if sentence_ends:
-        # Find the last sentence end before max_chars
-        for match in reversed(sentence_ends):
-            if match.end() <= max_chars:
-                return text[:match.end()].strip()
+    # Find the last sentence end before max_chars (ends only grow, so stop
+    # at the first one past it)
+    cut = 0
+    for match in SENTENCE_END_RE.finditer(text, 0, max_chars + 50):
+        if match.end() > max_chars:
+            break
+        cut = match.end()
+    if cut:
+        return text[:cut].strip()
 
     # Fallback: truncate at word boundary
     truncated = text[:max_chars]
@@ -1070,6 +1837,34 @@ def _truncate_at_sentence(text: str, max_chars: int) -> str:
     return truncated + "..."
 
 
+# Bump whenever _build_description_prompt or PROJECT_CONTEXT changes so
+# descriptions cached under the old prompt are regenerated
+PROMPT_VERSION = "1"
+
+# Content-addressed description cache: "<PROMPT_VERSION>:<content_hash>" -> description.
+# Survives renames, --limit runs and a deleted MOC, unlike reuse from the prior JSON
+_DESC_CACHE: Dict[str, str] = {}
+
+
+def _description_cache_key(content_hash: str) -> str:
+    return f"{PROMPT_VERSION}:{content_hash}"
+
+
+def load_description_cache(cache_path: Path) -> None:
+    """Load the persistent description cache, ignoring a missing or corrupt file."""
+    try:
+        with open(cache_path, encoding="utf-8") as f:
+            _DESC_CACHE.update(json.load(f))
+    except (OSError, ValueError):
+        pass
+
+
+def save_description_cache(cache_path: Path) -> None:
+    """Write the description cache (atomically, see _dump_json)."""
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    _dump_json(_DESC_CACHE, cache_path)
+
+
 def _build_description_prompt(context: Dict, category: str, rel_path: str) -> Tuple[str, str]:
     """Build prompt and system prompt for description generation."""
     system_prompt = f"""You are a technical documentation writer for the conscious-bot project.
@@ -1101,21 +1896,28 @@ Write a 1-3 sentence description starting with an action verb:"""
     return prompt, system_prompt
 
 
+# Preambles the model sometimes puts before the description itself
+DESCRIPTION_PREAMBLE_RE = re.compile(
+    "|".join(re.escape(p) for p in (
+        "The module ", "This module ", "The file ", "This file ",
+        "This Python module ", "The Python module ",
+        "Here is the description: ", "Description: ",
+    ))
+)
+
+
 def _clean_description_response(response: Optional[str], context: Dict) -> str:
     """Clean up a description response or fall back to docstring."""
     if response:
         response = response.strip()
 
         # Remove common preamble patterns
-        for prefix in [
-            "The module ", "This module ", "The file ", "This file ",
-            "This Python module ", "The Python module ",
-            "Here is the description: ", "Description: ",
-        ]:
-            if response.startswith(prefix):
-                response = response[len(prefix):]
-                if response:
-                    response = response[0].upper() + response[1:]
+        match = DESCRIPTION_PREAMBLE_RE.match(response)
+        while match:
+            response = response[match.end():]
+            if response:
+                response = response[0].upper() + response[1:]
+            match = DESCRIPTION_PREAMBLE_RE.match(response)
 
         # Remove trailing quotes or periods if doubled
         response = response.strip('"\'')
@@ -1153,17 +1955,12 @@ def generate_description(file_path: Path, context: Dict, category: str, rel_path
 def generate_descriptions_batch(
     items: List[Tuple[Path, Dict, str, str]],  # (file_path, context, category, rel_path)
     batch_size: int = 4,
+    max_batch_tokens: int = DEFAULT_MAX_BATCH_TOKENS,
+    max_new_tokens: int = DEFAULT_MAX_NEW_TOKENS,
 ) -> List[str]:
     """Generate descriptions for multiple modules in batches."""
     global _GLOBAL_MODEL
 
-    if not TRANSFORMERS_AVAILABLE or _GLOBAL_MODEL is None:
-        # Fall back to sequential processing
-        return [
-            generate_description(fp, ctx, cat, rp, use_transformers=False)
-            for fp, ctx, cat, rp in items
-        ]
-
     # Build all prompts
     prompt_pairs = []
     contexts = []
@@ -1172,8 +1969,23 @@ def generate_descriptions_batch(
         prompt_pairs.append((prompt, system_prompt))
         contexts.append(context)
 
-    # Generate in batches
-    responses = _generate_batch_with_transformers(prompt_pairs, batch_size=batch_size)
+    if not TRANSFORMERS_AVAILABLE or (_GLOBAL_MODEL is None and _GLOBAL_VLLM is None):
+        # Fall back to concurrent ollama requests (already parsed)
+        return [
+            _clean_description_response(response, context)
+            for response, context in zip(call_ollama_many(prompt_pairs), contexts)
+        ]
+
+    # Generate in batches (vLLM schedules its own)
+    if _GLOBAL_VLLM is not None:
+        responses = _generate_batch_with_vllm(prompt_pairs, max_new_tokens=max_new_tokens)
+    else:
+        responses = _generate_batch_with_transformers(
+            prompt_pairs,
+            max_new_tokens=max_new_tokens,
+            batch_size=batch_size,
+            max_batch_tokens=max_batch_tokens,
+        )
 
     # Clean up responses
     descriptions = []
@@ -1229,15 +2041,17 @@ def _staleness_to_legacy_status(staleness_level: str) -> str:
     return mapping.get(staleness_level, "stable")
 
 
-def get_category(file_path: Path, core_dir: Path) -> str:
-    """Get category based on packages/ directory structure."""
-    rel_path = file_path.relative_to(core_dir)
-    parts = rel_path.parts
+def get_category(file_path: Path, core_dir: Path, rel_path: Optional[str] = None) -> str:
+    """Get category based on packages/ directory structure.
+
+    Pass rel_path (file_path relative to core_dir) if the caller has it.
+    """
+    if rel_path is None:
+        rel_path = str(file_path.relative_to(core_dir))
 
-    if len(parts) >= 1:
-        category_key = parts[0]
-        if category_key in MODULE_CATEGORIES:
-            return MODULE_CATEGORIES[category_key]
+    category_key = rel_path.split(os.sep, 1)[0]
+    if category_key in MODULE_CATEGORIES:
+        return MODULE_CATEGORIES[category_key]
 
     if file_path.name in ("__init__.py", "index.ts", "index.tsx"):
         return "Package entry point"
@@ -1251,7 +2065,7 @@ def analyze_module(file_path: Path, core_dir: Path, use_ai: bool = True, use_tra
     rel_path_str = str(rel_path)
     metadata = get_file_metadata(file_path)
     context = extract_module_context(file_path)
-    category = get_category(file_path, core_dir)
+    category = get_category(file_path, core_dir, rel_path_str)
     todos = scan_todos(file_path, base_path=core_dir.parent)
 
     # Get staleness assessment
@@ -1299,31 +2113,33 @@ def analyze_module(file_path: Path, core_dir: Path, use_ai: bool = True, use_tra
             "lines": metadata["lines"],
             "size_bytes": metadata["size"],
             "author": _extract_author(context.get("docstring", "")),
-            "has_main": _has_main_block(file_path),
+            "has_main": metadata["has_main"],
         },
     }
 
 
+AUTHOR_RE = re.compile(r'@?[Aa]uthor:?\s*(@?\w+)')
+
+
 def _extract_author(docstring: str) -> Optional[str]:
     """Extract author from docstring if present."""
     if not docstring:
         return None
-    match = re.search(r'@?[Aa]uthor:?\s*(@?\w+)', docstring)
+    match = AUTHOR_RE.search(docstring)
     if match:
         return match.group(1)
     return None
 
 
-def _has_main_block(file_path: Path) -> bool:
-    """Check if file has a if __name__ == '__main__' block."""
-    content = _get_file_content(file_path)  # Use cached content
-    return 'if __name__' in content and '__main__' in content if content else False
+# Descriptions opening like this didn't follow the action-verb rule
+BAD_DESCRIPTION_STARTS = ("Module", "The ", "This ", "A ", "An ")
 
 
-def is_description_stale(existing_entry: Dict, file_mtime: datetime, moc_generated: datetime) -> Tuple[bool, str]:
+def is_description_stale(existing_entry: Dict, file_mtime: float, moc_generated: float) -> Tuple[bool, str]:
     """
     Determine if an existing description is stale and needs regeneration.
 
+    file_mtime and moc_generated are POSIX timestamps (st_mtime style).
     Returns (is_stale, reason).
     """
     description = existing_entry.get("description", "")
@@ -1341,8 +2157,7 @@ def is_description_stale(existing_entry: Dict, file_mtime: datetime, moc_generat
         return True, "file_modified"
 
     # Check 4: Description starts with bad patterns
-    bad_starts = ["Module", "The ", "This ", "A ", "An "]
-    if any(description.startswith(prefix) for prefix in bad_starts):
+    if description.startswith(BAD_DESCRIPTION_STARTS):
         return True, "bad_prefix"
 
     # Check 5: Description is suspiciously short for a substantial file
@@ -1353,6 +2168,30 @@ def is_description_stale(existing_entry: Dict, file_mtime: datetime, moc_generat
     return False, "current"
 
 
+def cached_description(prior_entry: Optional[Dict], content_hash: str) -> Optional[str]:
+    """Return a cached or prior description if the file content is unchanged.
+
+    The persistent description cache is checked first. The content hash
+    replaces the mtime check (checkouts and rebases touch mtimes without
+    changing content); the other staleness checks still apply.
+    """
+    cached = _DESC_CACHE.get(_description_cache_key(content_hash))
+    if cached is not None:
+        return cached
+    if not prior_entry:
+        return None
+    prior_metadata = prior_entry.get("metadata", {})
+    if prior_metadata.get("content_hash") != content_hash or prior_metadata.get("prompt_version") != PROMPT_VERSION:
+        return None
+    # Pass file_mtime == moc_generated so only the content checks can fire
+    is_stale, _ = is_description_stale(prior_entry, 0.0, 0.0)
+    return None if is_stale else prior_entry["description"]
+
+
+# Space between sentences once whitespace has been collapsed
+SENTENCE_BREAK_RE = re.compile(r"(?<=[.!?]) ")
+
+
 def clean_description(desc: str) -> str:
     """Clean description for display - take first paragraph or first 2 sentences."""
     if not desc:
@@ -1361,21 +2200,67 @@ def clean_description(desc: str) -> str:
     # Remove newlines and extra whitespace
     desc = " ".join(desc.split())
 
-    # Take first 2 sentences
-    import re
-
-    sentences = re.split(r"(?<=[.!?])\s+", desc)
-    if len(sentences) >= 2:
-        return " ".join(sentences[:2])
+    # Take first 2 sentences: cut at the second sentence break, if any
+    breaks = SENTENCE_BREAK_RE.finditer(desc)
+    if next(breaks, None) is not None:
+        second = next(breaks, None)
+        return desc[:second.start()] if second is not None else desc
 
     return desc[:250] if len(desc) > 250 else desc
 
 
-def generate_markdown(inventory: List[Dict], output_path: Path):
-    """Generate markdown documentation."""
+def _summarize_inventory(inventory: List[Dict]) -> Dict:
+    """Aggregate the counts used by the JSON statistics and the markdown
+    summary in a single pass over the inventory."""
+    by_status: Dict[str, int] = {}
+    by_staleness: Dict[str, int] = {}
+    todo_counts = dict.fromkeys(TODO_PRIORITIES, 0)
+    archive_candidates = []
+    total_lines = total_classes = total_functions = 0
+
+    for item in inventory:
+        status = item["status"]
+        by_status[status] = by_status.get(status, 0) + 1
+        staleness = item.get("staleness_level", "stable")
+        by_staleness[staleness] = by_staleness.get(staleness, 0) + 1
+        if item.get("archive_candidate"):
+            archive_candidates.append(item)
+
+        todos = item.get("todos", {})
+        for priority in TODO_PRIORITIES:
+            todo_counts[priority] += len(todos.get(priority, ()))
+
+        total_lines += item.get("metadata", {}).get("lines", 0) or 0
+        total_classes += len(item.get("classes", []))
+        total_functions += len(item.get("functions", []))
+
+    return {
+        "by_status": by_status,
+        "by_staleness": by_staleness,
+        "archive_candidates": archive_candidates,
+        "todos_by_priority": todo_counts,
+        "total_lines": total_lines,
+        "total_classes": total_classes,
+        "total_functions": total_functions,
+    }
+
+
+# Categories listed first in the markdown, in this order
+CATEGORY_RANK = {
+    category: rank
+    for rank, category in enumerate((
+        "Core module",
+        "Package initialization",
+        "State Hierarchy (core/state_model.py)",
+    ))
+}
+
+
+def _markdown_lines(inventory: List[Dict]):
+    """Yield the lines of the markdown document."""
     now = datetime.now()
 
-    lines = [
+    yield from [
         "# Conscious-Bot Core Map of Content",
         "",
         "**Author**: @darianrosebrook",
@@ -1402,36 +2287,26 @@ def generate_markdown(inventory: List[Dict], output_path: Path):
             by_category[cat] = []
         by_category[cat].append(item)
 
-    # Sort categories
-    category_order = [
-        "Core module",
-        "Package initialization",
-        "State Hierarchy (core/state_model.py)",
-    ]
-
+    # Sort categories: pinned ones first, then alphabetically
     sorted_categories = sorted(
         by_category.keys(),
-        key=lambda x: (
-            x not in category_order,
-            category_order.index(x) if x in category_order else 999,
-            x,
-        ),
+        key=lambda x: (CATEGORY_RANK.get(x, len(CATEGORY_RANK)), x),
     )
 
     for category in sorted_categories:
         items = by_category[category]
-        lines.append(f"## {category}")
-        lines.append("")
+        yield f"## {category}"
+        yield ""
 
         # Sort items by path
-        items.sort(key=lambda x: x["path"])
+        items.sort(key=itemgetter("path"))
 
         for item in items:
             if item["name"] in ("__init__.py", "index.ts", "index.tsx"):
                 continue  # Skip entry point files in detailed listing
 
-            lines.append(f"### {item['path']}")
-            lines.append("")
+            yield f"### {item['path']}"
+            yield ""
 
             # Build status line with staleness info
             staleness_level = item.get("staleness_level", item["status"])
@@ -1443,102 +2318,85 @@ def generate_markdown(inventory: List[Dict], output_path: Path):
             ]
             if item.get("archive_candidate"):
                 status_parts.append("**Archive Candidate**: Yes")
-            lines.append(" | ".join(status_parts))
-            lines.append("")
+            yield " | ".join(status_parts)
+            yield ""
 
             # Show staleness indicators if any
             if item.get("staleness_indicators"):
-                lines.append("**Staleness Indicators**:")
+                yield "**Staleness Indicators**:"
                 for indicator in item["staleness_indicators"][:3]:
-                    lines.append(f"  - {indicator}")
-                lines.append("")
+                    yield f"  - {indicator}"
+                yield ""
 
             if item["description"]:
                 desc = clean_description(item["description"])
-                lines.append(f"**Description**: {desc}")
-                lines.append("")
+                yield f"**Description**: {desc}"
+                yield ""
 
             if item["classes"]:
                 classes_str = ", ".join(f"`{c}`" for c in item["classes"][:5])
                 if len(item["classes"]) > 5:
                     classes_str += f" (+{len(item['classes']) - 5} more)"
-                lines.append(f"**Classes**: {classes_str}")
-                lines.append("")
+                yield f"**Classes**: {classes_str}"
+                yield ""
 
             if item["functions"]:
                 # Filter out private functions
                 public_funcs = [f for f in item["functions"] if not f.startswith("_")][:5]
                 if public_funcs:
                     funcs_str = ", ".join(f"`{f}`" for f in public_funcs)
-                    lines.append(f"**Key Functions**: {funcs_str}")
-                    lines.append("")
+                    yield f"**Key Functions**: {funcs_str}"
+                    yield ""
 
-            lines.append("---")
-            lines.append("")
+            yield "---"
+            yield ""
 
     # Summary
-    lines.append("## Summary Statistics")
-    lines.append("")
-    lines.append(f"- **Total Modules**: {len(inventory)}")
+    summary = _summarize_inventory(inventory)
+    yield "## Summary Statistics"
+    yield ""
+    yield f"- **Total Modules**: {len(inventory)}"
 
     # Staleness level counts (new)
-    staleness_counts = {}
-    for item in inventory:
-        s = item.get("staleness_level", "stable")
-        staleness_counts[s] = staleness_counts.get(s, 0) + 1
+    staleness_counts = summary["by_staleness"]
 
-    lines.append("")
-    lines.append("### By Staleness Level")
-    lines.append("")
+    yield ""
+    yield "### By Staleness Level"
+    yield ""
     staleness_order = ["active", "current", "stable", "review_needed", "potentially_stale", "likely_stale", "deprecated", "archived"]
     for level in staleness_order:
         if level in staleness_counts:
-            lines.append(f"- **{level}**: {staleness_counts[level]}")
+            yield f"- **{level}**: {staleness_counts[level]}"
 
     # Archive candidates
-    archive_candidates = [item for item in inventory if item.get("archive_candidate")]
+    archive_candidates = summary["archive_candidates"]
     if archive_candidates:
-        lines.append("")
-        lines.append(f"### Archive Candidates ({len(archive_candidates)} modules)")
-        lines.append("")
+        yield ""
+        yield f"### Archive Candidates ({len(archive_candidates)} modules)"
+        yield ""
         for item in archive_candidates[:10]:
             reasons = ", ".join(item.get("archive_reasons", [])[:2])
-            lines.append(f"- `{item['path']}` - {reasons}")
+            yield f"- `{item['path']}` - {reasons}"
         if len(archive_candidates) > 10:
-            lines.append(f"- ... and {len(archive_candidates) - 10} more")
+            yield f"- ... and {len(archive_candidates) - 10} more"
 
     # Legacy status counts (for backward compatibility)
-    status_counts = {}
-    for item in inventory:
-        s = item["status"]
-        status_counts[s] = status_counts.get(s, 0) + 1
+    status_counts = summary["by_status"]
 
-    lines.append("")
-    lines.append("### By Legacy Status")
-    lines.append("")
+    yield ""
+    yield "### By Legacy Status"
+    yield ""
     for status, count in sorted(status_counts.items()):
-        lines.append(f"- **{status.title()}**: {count}")
+        yield f"- **{status.title()}**: {count}"
 
-    total_lines = sum(item["metadata"]["lines"] for item in inventory)
-    lines.append(f"- **Total Lines of Code**: {total_lines:,}")
+    yield f"- **Total Lines of Code**: {summary['total_lines']:,}"
     
     # TODO priority breakdown
-    lines.append("")
-    lines.append("### TODO Priority Breakdown")
-    lines.append("")
+    yield ""
+    yield "### TODO Priority Breakdown"
+    yield ""
     
-    todo_counts = {
-        "P0-GOV": 0,
-        "P1-METRIC": 0,
-        "P2-QUAL": 0,
-        "P3-UX": 0,
-        "untagged": 0
-    }
-    
-    for item in inventory:
-        todos = item.get("todos", {})
-        for priority in todo_counts.keys():
-            todo_counts[priority] += len(todos.get(priority, []))
+    todo_counts = summary["todos_by_priority"]
     
     priority_labels = {
         "P0-GOV": "P0-GOV (Stop-the-line governance blockers)",
@@ -1548,19 +2406,53 @@ def generate_markdown(inventory: List[Dict], output_path: Path):
         "untagged": "Untagged TODOs"
     }
     
-    for priority in ["P0-GOV", "P1-METRIC", "P2-QUAL", "P3-UX", "untagged"]:
+    for priority in TODO_PRIORITIES:
         count = todo_counts[priority]
         if count > 0:
-            lines.append(f"- **{priority_labels[priority]}**: {count}")
+            yield f"- **{priority_labels[priority]}**: {count}"
     
     total_todos = sum(todo_counts.values())
     if total_todos > 0:
-        lines.append(f"- **Total TODOs**: {total_todos}")
+        yield f"- **Total TODOs**: {total_todos}"
+
 
-    output_path.write_text("\n".join(lines), encoding="utf-8")
+
+def generate_markdown(inventory: List[Dict], output_path: Path):
+    """Generate markdown documentation, writing lines as they are produced."""
+    with open(output_path, "w", encoding="utf-8") as f:
+        lines = _markdown_lines(inventory)
+        f.write(next(lines))
+        for line in lines:
+            f.write("\n")
+            f.write(line)
     print(f"Generated: {output_path}")
 
 
+# Distinguishes temp files, e.g. a checkpoint interrupted by the Ctrl+C save
+_TMP_FILE_IDS = itertools.count()
+
+
+def _dump_json(obj, output_path: Path):
+    """Write obj as indented UTF-8 JSON, via orjson when installed.
+
+    Both writers emit non-ASCII characters as UTF-8 rather than \\u
+    escapes, so the file is the same whichever one ran. The JSON goes to a
+    temp file that replaces output_path only once complete, so an
+    interrupted checkpoint never leaves a truncated file behind.
+    """
+    tmp_path = output_path.with_name(f"{output_path.name}.{os.getpid()}-{next(_TMP_FILE_IDS)}.tmp")
+    try:
+        if orjson is not None:
+            tmp_path.write_bytes(orjson.dumps(obj, option=orjson.OPT_INDENT_2))
+        else:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(obj, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
 def generate_json(inventory: List[Dict], output_path: Path):
     """Generate JSON inventory."""
     now = datetime.now()
@@ -1582,48 +2474,18 @@ def generate_json(inventory: List[Dict], output_path: Path):
         output["categories"][cat].append(item["path"])
 
     # Statistics
-    status_counts = {}
-    for item in inventory:
-        s = item["status"]
-        status_counts[s] = status_counts.get(s, 0) + 1
-
-    # TODO priority breakdown
-    todo_counts = {
-        "P0-GOV": 0,
-        "P1-METRIC": 0,
-        "P2-QUAL": 0,
-        "P3-UX": 0,
-        "untagged": 0
-    }
-
-    for item in inventory:
-        todos = item.get("todos", {})
-        for priority in todo_counts.keys():
-            todo_counts[priority] += len(todos.get(priority, []))
-
-    # Safely compute statistics
-    total_lines = 0
-    total_classes = 0
-    total_functions = 0
-
-    for item in inventory:
-        metadata = item.get("metadata", {})
-        total_lines += metadata.get("lines", 0) or 0
-        total_classes += len(item.get("classes", []))
-        total_functions += len(item.get("functions", []))
-
+    summary = _summarize_inventory(inventory)
     output["statistics"] = {
-        "by_status": status_counts,
+        "by_status": summary["by_status"],
         "by_category": {cat: len(paths) for cat, paths in output["categories"].items()},
-        "total_lines": total_lines,
-        "total_classes": total_classes,
-        "total_functions": total_functions,
-        "todos_by_priority": todo_counts,
-        "total_todos": sum(todo_counts.values()),
+        "total_lines": summary["total_lines"],
+        "total_classes": summary["total_classes"],
+        "total_functions": summary["total_functions"],
+        "todos_by_priority": summary["todos_by_priority"],
+        "total_todos": sum(summary["todos_by_priority"].values()),
     }
 
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(output, f, indent=2)
+    _dump_json(output, output_path)
 
     print(f"Generated: {output_path}")
 
@@ -1638,75 +2500,233 @@ def generate_csv(inventory: List[Dict], output_path: Path):
         "modified", "author", "todo_count"
     ]
 
-    with open(output_path, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction="ignore")
-        writer.writeheader()
-
+    def rows():
+        # Positional rows in fieldnames order
         for item in inventory:
             metadata = item.get("metadata", {})
             todos = item.get("todos", {})
-            todo_count = sum(len(todos.get(p, [])) for p in todos)
-
-            row = {
-                "path": item.get("path", ""),
-                "name": item.get("name", ""),
-                "category": item.get("category", ""),
-                "status": item.get("status", ""),
-                "description": item.get("description", ""),
-                "classes": ", ".join(item.get("classes", [])[:5]),
-                "functions": ", ".join(item.get("functions", [])[:5]),
-                "lines": metadata.get("lines", 0),
-                "size_bytes": metadata.get("size_bytes", 0),
-                "modified": metadata.get("modified", ""),
-                "author": metadata.get("author", ""),
-                "todo_count": todo_count,
-            }
-            writer.writerow(row)
+            yield (
+                item.get("path", ""),
+                item.get("name", ""),
+                item.get("category", ""),
+                item.get("status", ""),
+                item.get("description", ""),
+                ", ".join(item.get("classes", [])[:5]),
+                ", ".join(item.get("functions", [])[:5]),
+                metadata.get("lines", 0),
+                metadata.get("size_bytes", 0),
+                metadata.get("modified", ""),
+                metadata.get("author", ""),
+                sum(len(entries) for entries in todos.values()),
+            )
+
+    with open(output_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(fieldnames)
+        writer.writerows(rows())
 
     print(f"Generated: {output_path}")
 
 
+def _extract_file_context(
+    file_path: Path, rel_path: str, core_dir: Path, stat: Optional[os.stat_result] = None
+) -> Tuple[str, Dict]:
+    """Extract metadata, context, TODOs and staleness for one file.
+
+    Returns only plain data (no AST objects), so it can run in a worker
+    process and be pickled back to the parent.
+    """
+    try:
+        metadata = get_file_metadata(file_path, stat=stat)
+        context = extract_module_context(file_path)
+        metadata["author"] = _extract_author(context.get("docstring", ""))
+        category = get_category(file_path, core_dir, rel_path)
+        todos = scan_todos(file_path, base_path=core_dir.parent)
+
+        # Get staleness assessment
+        staleness = determine_status(file_path, metadata, context)
+        status = _staleness_to_legacy_status(staleness.get("staleness_level", "stable"))
+
+        return rel_path, {
+            "metadata": metadata,
+            "context": context,
+            "category": category,
+            "status": status,
+            "staleness": staleness,
+            "todos": todos,
+        }
+    except Exception as e:
+        return rel_path, {"error": str(e)}
+
+
+def _init_extract_worker():
+    """Leave Ctrl+C/SIGTERM to the parent, which owns the save-on-interrupt."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+def _extract_file_context_in_worker(args) -> Tuple[str, Dict]:
+    """Process-pool entry point: the file is only needed for this call, so
+    drop it from the worker's own cache afterwards."""
+    try:
+        return _extract_file_context(*args)
+    finally:
+        _clear_file_cache()
+
+
+def _extract_mp_context():
+    """Start extraction workers by fork on Linux.
+
+    Forked workers inherit this module (and torch/transformers, if
+    installed) instead of re-importing it, as spawn and forkserver (the
+    Python 3.14+ default) do. Extraction runs before any model is loaded,
+    so there is no GPU state to inherit. macOS keeps its default (spawn),
+    where forking after system frameworks load is unsafe.
+    """
+    if sys.platform == "linux":
+        return multiprocessing.get_context("fork")
+    return None
+
+
 def _extract_context_parallel(
     files_to_process: List[Tuple[Path, str]],  # (file_path, rel_path)
     core_dir: Path,
     max_workers: int = 4,
+    file_stats: Optional[Dict[Path, os.stat_result]] = None,
 ) -> Dict[str, Dict]:
-    """Extract context for multiple files in parallel."""
-    results = {}
+    """Extract context for multiple files in parallel.
 
-    def process_file(args):
-        file_path, rel_path = args
+    Parsing and regex scanning hold the GIL, so with more than one worker
+    files are processed in a process pool. Each worker reads its own files.
+    If the pool can't be started, extraction falls back to threads.
+
+    file_stats maps paths to stat results already taken by the caller, which
+    are reused for metadata instead of stat-ing each file again.
+    """
+    file_stats = file_stats or {}
+    tasks = [
+        (file_path, rel_path, core_dir, file_stats.get(file_path))
+        for file_path, rel_path in files_to_process
+    ]
+
+    if max_workers > 1 and len(tasks) > 1:
         try:
-            # Pre-cache file content
-            _get_file_content(file_path)
-            metadata = get_file_metadata(file_path)
-            context = extract_module_context(file_path)
-            category = get_category(file_path, core_dir)
-            todos = scan_todos(file_path, base_path=core_dir.parent)
-
-            # Get staleness assessment
-            staleness = determine_status(file_path, metadata, context)
-            status = _staleness_to_legacy_status(staleness.get("staleness_level", "stable"))
-
-            return rel_path, {
-                "metadata": metadata,
-                "context": context,
-                "category": category,
-                "status": status,
-                "staleness": staleness,
-                "todos": todos,
-                "file_path": file_path,
-            }
-        except Exception as e:
-            return rel_path, {"error": str(e)}
+            chunksize = max(1, len(tasks) // (max_workers * 4))
+            with ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=_extract_mp_context(),
+                initializer=_init_extract_worker,
+            ) as executor:
+                return dict(executor.map(_extract_file_context_in_worker, tasks, chunksize=chunksize))
+        except (OSError, BrokenProcessPool) as e:
+            print(f"  Process pool unavailable ({e}); extracting with threads")
 
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = {executor.submit(process_file, args): args for args in files_to_process}
-        for future in as_completed(futures):
-            rel_path, data = future.result()
-            results[rel_path] = data
+    return _extract_context_threaded(tasks, max_workers)
 
-    return results
+
+def _extract_context_threaded(tasks: List[Tuple], max_workers: int) -> Dict[str, Dict]:
+    """Thread-pool extraction.
+
+    File reads are issued on a separate, wider I/O pool so they run ahead of
+    the (GIL-bound) parsing workers; each worker only waits for its own
+    file's prefetch before extracting from the warmed cache.
+    """
+    prefetched = {}
+
+    def process_file(task):
+        # Wait for this file's prefetch (cache is warm afterwards), then
+        # drop the future so finished files don't keep theirs alive
+        prefetched.pop(task[0]).result()
+        return _extract_file_context(*task)
+
+    io_workers = min(32, (os.cpu_count() or 1) * 4)
+    with ThreadPoolExecutor(max_workers=io_workers) as io_pool, \
+            ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        for task in tasks:
+            prefetched[task[0]] = io_pool.submit(_get_file_content, task[0])
+        return dict(executor.map(process_file, tasks))
+
+
+SOURCE_EXTENSIONS = (".py", ".ts", ".tsx")
+# Directories and files whose name contains one of these are skipped
+EXCLUDED_NAME_MARKERS = ("__pycache__", "node_modules", "__tests__")
+EXCLUDED_DIR_NAMES = frozenset(("dist", "tests"))
+# Declarations and tests, matched against the lowercased file name
+EXCLUDED_FILE_SUFFIXES = (".d.ts", ".test.ts", ".test.tsx", ".spec.ts", ".spec.tsx", "_test.py")
+
+
+def _iter_source_files(root: Path):
+    """Yield (path, stat result) for the Python/TypeScript source files under root.
+
+    One os.scandir walk: excluded directories (node_modules, dist, tests,
+    ...) are pruned without being descended into, and test/declaration
+    files are rejected by name. Symlinked directories are not followed.
+    The stat result is carried into the staleness check and file metadata,
+    so each file is stat-ed once per run.
+    """
+    pending = [str(root)]
+    while pending:
+        try:
+            with os.scandir(pending.pop()) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        for entry in entries:
+            name = entry.name
+            if any(marker in name for marker in EXCLUDED_NAME_MARKERS):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                if name not in EXCLUDED_DIR_NAMES:
+                    pending.append(entry.path)
+                continue
+            if not name.endswith(SOURCE_EXTENSIONS):
+                continue
+            lower = name.lower()
+            if lower.endswith(EXCLUDED_FILE_SUFFIXES) or (lower.startswith("test_") and lower.endswith(".py")):
+                continue
+            if entry.is_file():
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue  # Vanished since the directory was listed
+                yield Path(entry.path), stat
+
+
+def _make_entry(file_path: Path, rel_path: str, data: Dict, description: str) -> Dict:
+    """Build the inventory entry for an extracted file."""
+    context = data["context"]
+    metadata = data["metadata"]
+    staleness = data.get("staleness", {})
+    return {
+        "path": rel_path,
+        "name": file_path.name,
+        "category": data["category"],
+        "status": data["status"],
+        "description": description,
+        "classes": context["classes"],
+        "functions": context["functions"][:10],
+        "imports": context["imports"][:10],
+        "constants": context.get("constants", [])[:10],
+        "decorators_used": context.get("decorators_used", []),
+        "todos": data["todos"],
+        # Staleness assessment fields
+        "staleness_level": staleness.get("staleness_level", "stable"),
+        "staleness_score": staleness.get("staleness_score", 0.0),
+        "staleness_indicators": staleness.get("staleness_indicators", []),
+        "recommendation": staleness.get("recommendation", "Review"),
+        "archive_candidate": staleness.get("archive_candidate", False),
+        "archive_reasons": staleness.get("archive_reasons", []),
+        "metadata": {
+            "created": metadata["created"],
+            "modified": metadata["modified"],
+            "modified_days_ago": metadata["modified_days_ago"],
+            "lines": metadata["lines"],
+            "size_bytes": metadata["size"],
+            "content_hash": metadata["content_hash"],
+            "author": metadata["author"],
+            "has_main": metadata["has_main"],
+        },
+    }
 
 
 def main():
@@ -1718,10 +2738,23 @@ def main():
 
     parser = argparse.ArgumentParser(description="Generate core module inventory")
     parser.add_argument("--batch-size", type=int, default=4, help="Batch size for LLM generation")
+    parser.add_argument("--max-batch-tokens", type=int, default=DEFAULT_MAX_BATCH_TOKENS,
+                        help="Max padded prompt tokens per LLM generation batch")
+    parser.add_argument("--max-new-tokens", type=int, default=DEFAULT_MAX_NEW_TOKENS,
+                        help="Max tokens generated per description")
+    parser.add_argument("--sample", action="store_true",
+                        help="Sample descriptions (temperature 0.7, top-p 0.9) instead of greedy decoding")
+    parser.add_argument("--compile", action="store_true", help="torch.compile the transformers model (slower start, faster batches)")
+    parser.add_argument("--quantize", choices=["none", "int8", "int4"], default="none",
+                        help="Load transformers weights quantized via bitsandbytes (CUDA only)")
     parser.add_argument("--dry-run", action="store_true", help="Process only first 5 files")
     parser.add_argument("--force", action="store_true", help="Force regeneration of all descriptions")
     parser.add_argument("--limit", type=int, help="Limit number of files to process")
     parser.add_argument("--model-path", type=str, help="Path to local transformers model")
+    parser.add_argument("--engine", choices=["transformers", "vllm"], default="transformers",
+                        help="Local generation backend (vllm: continuous batching, needs CUDA)")
+    parser.add_argument("--draft-model", type=str,
+                        help="Path to a small model sharing the tokenizer, for speculative decoding (implies --batch-size 1)")
     parser.add_argument("--model", type=str, default="llama3.2:latest", help="Ollama model to use")
     parser.add_argument("--no-ai", action="store_true", help="Skip AI descriptions")
     parser.add_argument("--output-dir", type=str, help="Output directory (default: docs/MOC)")
@@ -1729,9 +2762,19 @@ def main():
     parser.add_argument("--save-interval", type=int, default=50, help="Save progress every N files")
     parser.add_argument("--source-dir", type=str, default="packages", help="Source directory to scan (default: packages)")
     parser.add_argument("--use-ollama", action="store_true", help="Force use of ollama instead of transformers")
-    parser.add_argument("--workers", type=int, default=4, help="Number of parallel workers for context extraction")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4,
+                        help="Number of worker processes for context extraction (1 = in-process threads)")
     args = parser.parse_args()
 
+    global _SAMPLE_DESCRIPTIONS
+    _SAMPLE_DESCRIPTIONS = args.sample
+
+    # Module and library objects (torch/transformers included) live for the
+    # whole run; move them out of the collector's generations so automatic
+    # collections don't keep rescanning them, and forked workers don't
+    # touch (and copy) their pages
+    gc.freeze()
+
     # Paths - navigate from scripts/utils to project root
     project_root = Path(__file__).resolve().parent.parent.parent
     core_dir = project_root / args.source_dir
@@ -1749,33 +2792,8 @@ def main():
     csv_output = output_dir / "CORE_MAP_OF_CONTENT.csv"
 
     # Find TypeScript and Python files
-    py_files = []
-    for ext in ("*.py", "*.ts", "*.tsx"):
-        py_files.extend(core_dir.rglob(ext))
-    py_files = sorted(set(py_files))
-
-    def _should_exclude(f: Path) -> bool:
-        s = str(f)
-        name = f.name.lower()
-        if "__pycache__" in s or "node_modules" in s:
-            return True
-        if "/dist/" in s or "\\dist\\" in s:
-            return True
-        if name.endswith(".d.ts"):
-            return True
-        if "__tests__" in s or "/tests/" in s or "\\tests\\" in s:
-            return True
-        if name.endswith(".test.ts") or name.endswith(".test.tsx"):
-            return True
-        if name.endswith(".spec.ts") or name.endswith(".spec.tsx"):
-            return True
-        if name.startswith("test_") and name.endswith(".py"):
-            return True
-        if name.endswith("_test.py"):
-            return True
-        return False
-
-    py_files = [f for f in py_files if not _should_exclude(f)]
+    source_stats = dict(_iter_source_files(core_dir))
+    py_files = sorted(source_stats)
 
     print(f"Found {len(py_files)} files in {args.source_dir}/")
 
@@ -1787,32 +2805,41 @@ def main():
         py_files = py_files[: args.limit]
         print(f"Limited to {len(py_files)} files")
 
-    # Load existing inventory for resume
-    existing = {}
+    # Load the previous inventory: with --resume fresh entries are reused
+    # whole; otherwise only descriptions of unchanged files are reused
+    prior = {}
     moc_generated = None
-    if args.resume and json_output.exists() and not args.force:
+    if json_output.exists() and not args.force:
         try:
             with open(json_output) as f:
                 data = json.load(f)
                 moc_generated = datetime.fromisoformat(data.get("generated", "2000-01-01"))
                 for item in data.get("modules", []):
-                    existing[item["path"]] = item
-            print(f"Loaded {len(existing)} existing entries (generated: {moc_generated.strftime('%Y-%m-%d %H:%M')})")
+                    prior[item["path"]] = item
+            print(f"Loaded {len(prior)} existing entries (generated: {moc_generated.strftime('%Y-%m-%d %H:%M')})")
         except Exception as e:
             print(f"Could not load existing JSON: {e}")
             moc_generated = datetime.min
 
     if moc_generated is None:
         moc_generated = datetime.min
+    # Phase 1 compares raw st_mtime floats against this
+    moc_generated_ts = float("-inf") if moc_generated == datetime.min else moc_generated.timestamp()
+
+    desc_cache_path = project_root / ".cache" / "core_inventory_descriptions.json"
+    if not args.force:
+        load_description_cache(desc_cache_path)
+    existing = prior if args.resume else {}
 
     # Categorize files: reuse vs needs processing
     use_ai = not args.no_ai
     use_transformers = not args.use_ollama
-    stats = {"reused": 0, "regenerated": 0, "new": 0, "errors": 0}
+    stats = {"reused": 0, "regenerated": 0, "new": 0, "errors": 0, "cached_descriptions": 0}
 
     inventory = []
     files_needing_ai = []  # (file_path, rel_path, context_data)
     files_to_extract = []  # (file_path, rel_path)
+    file_stats = {}  # file_path -> stat result, reused for metadata in Phase 2
 
     # Register global state for graceful shutdown
     _INVENTORY_STATE["inventory"] = inventory
@@ -1821,11 +2848,11 @@ def main():
     print("\nPhase 1: Checking staleness...")
     for file_path in py_files:
         rel_path = str(file_path.relative_to(core_dir))
-        file_mtime = datetime.fromtimestamp(file_path.stat().st_mtime)
+        stat = source_stats[file_path]
 
         if rel_path in existing and not args.force:
             existing_entry = existing[rel_path]
-            is_stale, reason = is_description_stale(existing_entry, file_mtime, moc_generated)
+            is_stale, reason = is_description_stale(existing_entry, stat.st_mtime, moc_generated_ts)
 
             if not is_stale:
                 inventory.append(existing_entry)
@@ -1837,6 +2864,7 @@ def main():
             stats["new"] += 1
 
         files_to_extract.append((file_path, rel_path))
+        file_stats[file_path] = stat
 
     print(f"  ✓ Reusing {stats['reused']} existing entries")
     print(f"  ↻ Need to process {len(files_to_extract)} files")
@@ -1846,27 +2874,18 @@ def main():
     else:
         # Phase 2: Extract context in parallel
         print(f"\nPhase 2: Extracting context ({args.workers} workers)...")
-        context_data = _extract_context_parallel(files_to_extract, core_dir, max_workers=args.workers)
+        context_data = _extract_context_parallel(
+            files_to_extract, core_dir, max_workers=args.workers, file_stats=file_stats
+        )
         print(f"  Extracted context for {len(context_data)} files")
 
-        # Clear file cache to free memory
+        # Clear file cache to free memory (reference counting frees it;
+        # a full gc.collect() here would only walk every live object)
         _clear_file_cache()
-        gc.collect()
 
-        # Phase 3: Initialize LLM if needed
-        if use_ai and use_transformers and TRANSFORMERS_AVAILABLE:
-            model_path = args.model_path if args.model_path else None
-            if _init_transformers_model(model_path):
-                print(f"\nPhase 3: Generating descriptions (batch_size={args.batch_size})...")
-            else:
-                print("Falling back to ollama")
-                use_transformers = False
-        elif use_ai and not TRANSFORMERS_AVAILABLE:
-            print("transformers not available, using ollama")
-            use_transformers = False
-
-        # Separate entry point files (no AI needed) from others
-        init_files = []
+        # Separate files that need no AI (entry points, unchanged files with a
+        # usable prior description) from the rest
+        init_files = []  # (file_path, rel_path, data, description or None)
         ai_needed_files = []
 
         for file_path, rel_path in files_to_extract:
@@ -1884,19 +2903,63 @@ def main():
                     "imports": [],
                     "constants": [],
                     "decorators_used": [],
-                    "todos": {"P0-GOV": [], "P1-METRIC": [], "P2-QUAL": [], "P3-UX": [], "untagged": []},
+                    "todos": _empty_todos(),
                     "metadata": {},
                 })
             elif file_path.name in ("__init__.py", "index.ts", "index.tsx") or not use_ai:
                 # No AI needed for entry points
-                init_files.append((file_path, rel_path, data))
+                init_files.append((file_path, rel_path, data, None))
+            else:
+                description = cached_description(prior.get(rel_path), data["metadata"]["content_hash"])
+                if description is not None:
+                    init_files.append((file_path, rel_path, data, description))
+                    stats["cached_descriptions"] += 1
+                else:
+                    ai_needed_files.append((file_path, rel_path, data))
+
+        if stats["cached_descriptions"]:
+            print(f"  ✓ Reusing {stats['cached_descriptions']} descriptions of unchanged files")
+
+        # Phase 3: Initialize LLM if needed
+        if not ai_needed_files:
+            use_ai = False  # Nothing left to describe; skip loading the model
+        elif use_ai and use_transformers and TRANSFORMERS_AVAILABLE:
+            model_path = args.model_path if args.model_path else None
+            if args.engine == "vllm" and _init_vllm_engine(model_path):
+                print("\nPhase 3: Generating descriptions (vLLM continuous batching)...")
+            elif _init_transformers_model(
+                model_path,
+                compile_model=args.compile,
+                quantize=args.quantize,
+                draft_model_path=args.draft_model,
+            ):
+                if _GLOBAL_DRAFT_MODEL is not None and args.batch_size != 1:
+                    # Assisted generation is single-sequence; batches would
+                    # silently run without the draft model
+                    print("  Draft model loaded; using batch size 1")
+                    args.batch_size = 1
+                print(f"\nPhase 3: Generating descriptions (batch_size={args.batch_size})...")
             else:
-                ai_needed_files.append((file_path, rel_path, data))
+                print("Falling back to ollama")
+                use_transformers = False
+        elif use_ai and not TRANSFORMERS_AVAILABLE:
+            print("transformers not available, using ollama")
+            use_transformers = False
+
+        if _GLOBAL_MODEL is not None or _GLOBAL_VLLM is not None:
+            # The model's modules and parameters stay resident until exit:
+            # drop the loading garbage once, then freeze the rest so the
+            # collections triggered during generation don't rescan them
+            gc.collect()
+            gc.freeze()
 
-        # Process entry point files (no AI)
-        for file_path, rel_path, data in init_files:
+        # Process entry point and cached-description files (no AI)
+        for file_path, rel_path, data, description in init_files:
             context = data["context"]
-            if context["docstring"]:
+            from_cache = description is not None
+            if from_cache:
+                pass  # Cached or prior description of an unchanged file
+            elif context["docstring"]:
                 description = _truncate_at_sentence(context["docstring"], 400)
             elif context["classes"]:
                 description = f"Defines {', '.join(context['classes'][:3])}."
@@ -1906,158 +2969,78 @@ def main():
             else:
                 description = ""
 
-            staleness = data.get("staleness", {})
-            entry = {
-                "path": rel_path,
-                "name": file_path.name,
-                "category": data["category"],
-                "status": data["status"],
-                "description": description,
-                "classes": context["classes"],
-                "functions": context["functions"][:10],
-                "imports": context["imports"][:10],
-                "constants": context.get("constants", [])[:10],
-                "decorators_used": context.get("decorators_used", []),
-                "todos": data["todos"],
-                # Staleness assessment fields
-                "staleness_level": staleness.get("staleness_level", "stable"),
-                "staleness_score": staleness.get("staleness_score", 0.0),
-                "staleness_indicators": staleness.get("staleness_indicators", []),
-                "recommendation": staleness.get("recommendation", "Review"),
-                "archive_candidate": staleness.get("archive_candidate", False),
-                "archive_reasons": staleness.get("archive_reasons", []),
-                "metadata": {
-                    "created": data["metadata"]["created"],
-                    "modified": data["metadata"]["modified"],
-                    "modified_days_ago": data["metadata"]["modified_days_ago"],
-                    "lines": data["metadata"]["lines"],
-                    "size_bytes": data["metadata"]["size"],
-                    "author": _extract_author(context.get("docstring", "")),
-                    "has_main": _has_main_block(file_path),
-                },
-            }
+            entry = _make_entry(file_path, rel_path, data, description)
+            if from_cache:
+                entry["metadata"]["prompt_version"] = PROMPT_VERSION
             inventory.append(entry)
 
         # Process files needing AI in batches
         if ai_needed_files and use_ai:
-            if use_transformers and TRANSFORMERS_AVAILABLE and _GLOBAL_MODEL is not None:
-                # Batch processing with transformers
-                total_ai_files = len(ai_needed_files)
-                print(f"  Processing {total_ai_files} files in batches of {args.batch_size}...")
-
-                # Process in smaller batches with progress logging
-                processed_count = 0
-                for batch_start in range(0, total_ai_files, args.batch_size):
-                    # Check for shutdown request
-                    if _SHUTDOWN_REQUESTED:
-                        print("\n  Stopping due to shutdown request...")
-                        break
-
-                    batch_end = min(batch_start + args.batch_size, total_ai_files)
-                    batch = ai_needed_files[batch_start:batch_end]
-
-                    # Show batch progress
-                    print(f"  [{batch_start + 1}-{batch_end}/{total_ai_files}] Generating descriptions...")
-
-                    # Prepare batch items
-                    batch_items = [
-                        (data["file_path"], data["context"], data["category"], rel_path)
-                        for file_path, rel_path, data in batch
-                    ]
-
-                    # Generate descriptions for this batch
-                    descriptions = generate_descriptions_batch(batch_items, batch_size=args.batch_size)
-
-                    # Build entries for this batch
-                    for (file_path, rel_path, data), description in zip(batch, descriptions):
-                        context = data["context"]
-                        staleness = data.get("staleness", {})
-                        entry = {
-                            "path": rel_path,
-                            "name": file_path.name,
-                            "category": data["category"],
-                            "status": data["status"],
-                            "description": description,
-                            "classes": context["classes"],
-                            "functions": context["functions"][:10],
-                            "imports": context["imports"][:10],
-                            "constants": context.get("constants", [])[:10],
-                            "decorators_used": context.get("decorators_used", []),
-                            "todos": data["todos"],
-                            # Staleness assessment fields
-                            "staleness_level": staleness.get("staleness_level", "stable"),
-                            "staleness_score": staleness.get("staleness_score", 0.0),
-                            "staleness_indicators": staleness.get("staleness_indicators", []),
-                            "recommendation": staleness.get("recommendation", "Review"),
-                            "archive_candidate": staleness.get("archive_candidate", False),
-                            "archive_reasons": staleness.get("archive_reasons", []),
-                            "metadata": {
-                                "created": data["metadata"]["created"],
-                                "modified": data["metadata"]["modified"],
-                                "modified_days_ago": data["metadata"]["modified_days_ago"],
-                                "lines": data["metadata"]["lines"],
-                                "size_bytes": data["metadata"]["size"],
-                                "author": _extract_author(context.get("docstring", "")),
-                                "has_main": _has_main_block(file_path),
-                            },
-                        }
-                        inventory.append(entry)
-                        processed_count += 1
-                        print(f"    ✓ {rel_path}")
-
-                    # Progressive save after each batch
-                    print(f"  [Checkpoint: {len(inventory)} entries, saving...]")
-                    generate_json(inventory, json_output)
-            else:
-                # Sequential processing with ollama or fallback
-                total_ai_files = len(ai_needed_files)
-                for i, (file_path, rel_path, data) in enumerate(ai_needed_files, 1):
-                    print(f"  [{i}/{total_ai_files}] {rel_path}...", end=" ", flush=True)
+            # Files are handed over a window at a time (checkpointing after
+            # each) so the backend can batch them: similar-length prompts
+            # share a generate() batch, vLLM schedules the window itself,
+            # and ollama requests run concurrently
+            total_ai_files = len(ai_needed_files)
+            window = max(args.batch_size, args.save_interval)
+            print(f"  Processing {total_ai_files} files in batches of up to {args.batch_size}...")
+
+            # Process in windows with progress logging
+            processed_count = 0
+            generated = {}  # description cache key -> description, shared by identical files
+            for batch_start in range(0, total_ai_files, window):
+                # Check for shutdown request
+                if _SHUTDOWN_REQUESTED:
+                    print("\n  Stopping due to shutdown request...")
+                    break
+
+                batch_end = min(batch_start + window, total_ai_files)
+                batch = ai_needed_files[batch_start:batch_end]
+
+                # Show batch progress
+                print(f"  [{batch_start + 1}-{batch_end}/{total_ai_files}] Generating descriptions...")
+
+                # Prepare batch items, one per distinct content (vendored
+                # copies of a file share the first copy's description)
+                keys = [_description_cache_key(data["metadata"]["content_hash"]) for _, _, data in batch]
+                unique = {}
+                for item, key in zip(batch, keys):
+                    if key not in generated and key not in unique:
+                        unique[key] = item
+                batch_items = [
+                    (file_path, data["context"], data["category"], rel_path)
+                    for file_path, rel_path, data in unique.values()
+                ]
+
+                # Generate descriptions for this batch
+                if batch_items:
+                    generated.update(zip(unique, generate_descriptions_batch(
+                        batch_items,
+                        batch_size=args.batch_size,
+                        max_batch_tokens=args.max_batch_tokens,
+                        max_new_tokens=args.max_new_tokens,
+                    )))
+
+                # Build entries for this batch
+                for (file_path, rel_path, data), key in zip(batch, keys):
+                    description = generated[key]
                     context = data["context"]
-                    description = generate_description(
-                        file_path, context, data["category"], rel_path,
-                        use_transformers=False
-                    )
-                    staleness = data.get("staleness", {})
-                    entry = {
-                        "path": rel_path,
-                        "name": file_path.name,
-                        "category": data["category"],
-                        "status": data["status"],
-                        "description": description,
-                        "classes": context["classes"],
-                        "functions": context["functions"][:10],
-                        "imports": context["imports"][:10],
-                        "constants": context.get("constants", [])[:10],
-                        "decorators_used": context.get("decorators_used", []),
-                        "todos": data["todos"],
-                        # Staleness assessment fields
-                        "staleness_level": staleness.get("staleness_level", "stable"),
-                        "staleness_score": staleness.get("staleness_score", 0.0),
-                        "staleness_indicators": staleness.get("staleness_indicators", []),
-                        "recommendation": staleness.get("recommendation", "Review"),
-                        "archive_candidate": staleness.get("archive_candidate", False),
-                        "archive_reasons": staleness.get("archive_reasons", []),
-                        "metadata": {
-                            "created": data["metadata"]["created"],
-                            "modified": data["metadata"]["modified"],
-                            "modified_days_ago": data["metadata"]["modified_days_ago"],
-                            "lines": data["metadata"]["lines"],
-                            "size_bytes": data["metadata"]["size"],
-                            "author": _extract_author(context.get("docstring", "")),
-                            "has_main": _has_main_block(file_path),
-                        },
-                    }
+                    entry = _make_entry(file_path, rel_path, data, description)
+                    entry["metadata"]["prompt_version"] = PROMPT_VERSION
                     inventory.append(entry)
-                    print("✓")
+                    processed_count += 1
+                    print(f"    ✓ {rel_path}")
+
+                    # Don't pin the docstring fallback of a failed generation
+                    if description != _clean_description_response(None, context):
+                        _DESC_CACHE[key] = description
 
-                    # Progressive save every N files
-                    if i % args.save_interval == 0:
-                        print(f"  [Checkpoint: {len(inventory)} entries saved]")
-                        generate_json(inventory, json_output)
+                # Progressive save after each batch
+                print(f"  [Checkpoint: {len(inventory)} entries, saving...]")
+                generate_json(inventory, json_output)
+                save_description_cache(desc_cache_path)
 
     # Sort inventory by path for consistent output
-    inventory.sort(key=lambda x: x["path"])
+    inventory.sort(key=itemgetter("path"))
 
     # Generate outputs
     print("\nPhase 4: Generating outputs...")
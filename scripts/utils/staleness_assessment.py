@@ -9,13 +9,15 @@ Uses multiple signals beyond just modification date to determine true staleness.
 Author: @darianrosebrook
 """
 
+import bisect
 import re
 import subprocess
+import time
 from dataclasses import dataclass, field
 from datetime import datetime
 from enum import Enum
 from pathlib import Path
-from typing import Dict, List, Optional, Set, Tuple
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
 
 class StalenessLevel(Enum):
@@ -30,7 +32,7 @@ class StalenessLevel(Enum):
     ARCHIVED = "archived"
 
 
-@dataclass
+@dataclass(slots=True)
 class StalenessSignal:
     """A single staleness signal with weight and reason."""
     name: str
@@ -39,7 +41,7 @@ class StalenessSignal:
     category: str
 
 
-@dataclass
+@dataclass(slots=True)
 class StalenessAssessment:
     """Complete staleness assessment for a file."""
     level: StalenessLevel
@@ -69,6 +71,33 @@ DEPRECATED_PATTERNS = {
     r"session[_-]": ("session_doc", 0.7, "Session-specific document (temporal)"),
     r"status[_-]report": ("status_report", 0.6, "Status report (temporal)"),
 }
+_REGEX_METACHARS = frozenset(".*+?[](){}|^$\\")
+
+
+def _pattern_matcher(pattern: str):
+    """Plain substring test for literal patterns, compiled search otherwise."""
+    if _REGEX_METACHARS.isdisjoint(pattern):
+        return lambda text: pattern in text
+    return re.compile(pattern).search
+
+
+_DEPRECATED_CHECKS = [
+    (_pattern_matcher(pattern), name, weight, reason)
+    for pattern, (name, weight, reason) in DEPRECATED_PATTERNS.items()
+]
+# Union of all patterns: one scan rules out the common no-match case. The
+# individual patterns still run on a hit, since their matches can overlap
+_DEPRECATED_ANY_RE = re.compile("|".join(f"(?:{pattern})" for pattern in DEPRECATED_PATTERNS))
+
+ARCHIVE_DOC_PATTERNS = (
+    (re.compile(r"session[_-]"), "Session-specific document"),
+    (re.compile(r"status[_-]report"), "Status report"),
+    (re.compile(r".*[_-]summary$"), "Summary document"),
+    (re.compile(r".*[_-]report$"), "Report document"),
+)
+ARCHIVE_CODE_PATTERNS = (
+    (re.compile(r"_old(?:_|\.ts|$)"), "References old version"),
+)
 
 # conscious-bot specific - extend as deprecated patterns are identified
 DEPRECATED_IMPORTS = {}
@@ -83,8 +112,111 @@ TEMPORAL_THRESHOLDS = {
 }
 
 
+# Git history loaded by prime_git_cache():
+# resolved path -> (commits in the last _GIT_CACHE_DAYS days, last commit date)
+_GIT_CACHE: Dict[Path, Tuple[int, Optional[datetime]]] = {}
+_GIT_CACHE_DAYS = 90
+_GIT_COMMIT_MARKER = "__C__ "
+# Paths per git invocation, keeping the command line well under OS limits
+_GIT_PATHSPEC_CHUNK = 500
+
+
+def _git_toplevel(directory: Path) -> Optional[Path]:
+    """Find the nearest enclosing directory that has a .git entry."""
+    for candidate in (directory, *directory.parents):
+        if (candidate / ".git").exists():
+            return candidate
+    return None
+
+
+def _git_log_names(
+    repo_root: Path,
+    paths: List[Path],
+    cutoff: float,
+) -> Optional[Dict[Path, Tuple[int, Optional[datetime]]]]:
+    """Walk the history of paths once; returns None if git fails."""
+    try:
+        result = subprocess.run(
+            [
+                "git", "-c", "core.quotePath=false", "log", "--name-only",
+                f"--format={_GIT_COMMIT_MARKER}%ct %ci", "--",
+                *(str(p.relative_to(repo_root)) for p in paths),
+            ],
+            capture_output=True,
+            text=True,
+            timeout=60,
+            cwd=repo_root,
+        )
+    except Exception:
+        return None
+    if result.returncode != 0:
+        return None
+
+    history: Dict[Path, Tuple[int, Optional[datetime]]] = {}
+    commit_ts, commit_date = 0, None
+    for line in result.stdout.splitlines():
+        if line.startswith(_GIT_COMMIT_MARKER):
+            timestamp, _, date_str = line[len(_GIT_COMMIT_MARKER):].partition(" ")
+            commit_ts = int(timestamp)
+            commit_date = datetime.strptime(date_str[:19], "%Y-%m-%d %H:%M:%S")
+        elif line:
+            # Log order is newest first, so the first date seen is the last commit
+            path = repo_root / line
+            count, last_date = history.get(path, (0, None))
+            history[path] = (count + (commit_ts >= cutoff), last_date or commit_date)
+    return history
+
+
+def prime_git_cache(paths: Iterable[Path], days: int = 90) -> None:
+    """Load commit counts and last commit dates for many files at once.
+
+    Runs one git log walk per repository (and per chunk of paths) instead
+    of a git process per file and query; get_git_commit_count and
+    get_git_last_commit_date read the results and only run git on a miss.
+    """
+    global _GIT_CACHE_DAYS
+    if days != _GIT_CACHE_DAYS:
+        _GIT_CACHE.clear()
+        _GIT_CACHE_DAYS = days
+
+    by_repo: Dict[Path, List[Path]] = {}
+    for path in paths:
+        path = Path(path).resolve()
+        repo_root = _git_toplevel(path.parent)
+        if repo_root is not None:
+            by_repo.setdefault(repo_root, []).append(path)
+
+    cutoff = time.time() - days * 86400
+    for repo_root, repo_paths in by_repo.items():
+        for start in range(0, len(repo_paths), _GIT_PATHSPEC_CHUNK):
+            chunk = repo_paths[start:start + _GIT_PATHSPEC_CHUNK]
+            history = _git_log_names(repo_root, chunk, cutoff)
+            if history is None:
+                continue  # Leave these files to the per-file queries
+            for path in chunk:
+                _GIT_CACHE[path] = history.get(path, (0, None))
+
+
+def _cached_git_history(file_path: Path) -> Optional[Tuple[int, Optional[datetime]]]:
+    """Cached (commit count, last commit date), loading the file on a miss.
+
+    A single walk answers both queries, so a file that wasn't primed costs
+    one git process rather than one per query.
+    """
+    path = file_path.resolve()
+    cached = _GIT_CACHE.get(path)
+    if cached is None:
+        prime_git_cache([path], days=_GIT_CACHE_DAYS)
+        cached = _GIT_CACHE.get(path)
+    return cached
+
+
 def get_git_commit_count(file_path: Path, days: int = 90) -> int:
     """Get number of git commits touching this file in the last N days."""
+    if days == _GIT_CACHE_DAYS:
+        cached = _cached_git_history(file_path)
+        if cached is not None:
+            return cached[0]
     try:
         result = subprocess.run(
             ["git", "log", f"--since={days} days ago", "--oneline", "--", str(file_path)],
@@ -102,6 +234,9 @@ def get_git_commit_count(file_path: Path, days: int = 90) -> int:
 
 def get_git_last_commit_date(file_path: Path) -> Optional[datetime]:
     """Get the date of the last git commit touching this file."""
+    cached = _cached_git_history(file_path)
+    if cached is not None:
+        return cached[1]
     try:
         result = subprocess.run(
             ["git", "log", "-1", "--format=%ci", "--", str(file_path)],
@@ -122,10 +257,15 @@ def check_deprecated_patterns(path: str, content: str = "") -> List[StalenessSig
     """Check for deprecated patterns in path and content."""
     signals = []
     path_lower = path.lower()
-    content_lower = content.lower() if content else ""
+    content_head = content[:1000].lower() if content else ""
+
+    path_hit = _DEPRECATED_ANY_RE.search(path_lower) is not None
+    content_hit = bool(content_head) and _DEPRECATED_ANY_RE.search(content_head) is not None
+    if not (path_hit or content_hit):
+        return signals
 
-    for pattern, (name, weight, reason) in DEPRECATED_PATTERNS.items():
-        if re.search(pattern, path_lower) or (content and re.search(pattern, content_lower[:1000])):
+    for matches, name, weight, reason in _DEPRECATED_CHECKS:
+        if (path_hit and matches(path_lower)) or (content_hit and matches(content_head)):
             signals.append(StalenessSignal(
                 name=name,
                 weight=weight,
@@ -229,21 +369,12 @@ def check_archive_candidate(
     if "archive" in path_lower:
         return False, []
     if content_type == "documentation":
-        temporal_patterns = [
-            (r"session[_-]", "Session-specific document"),
-            (r"status[_-]report", "Status report"),
-            (r".*[_-]summary$", "Summary document"),
-            (r".*[_-]report$", "Report document"),
-        ]
-        for pattern, reason in temporal_patterns:
-            if re.search(pattern, path_lower):
+        for pattern, reason in ARCHIVE_DOC_PATTERNS:
+            if pattern.search(path_lower):
                 reasons.append(reason)
     if content_type in ("code", "script"):
-        version_patterns = [
-            (r"_old(?:_|\.ts|$)", "References old version"),
-        ]
-        for pattern, reason in version_patterns:
-            if re.search(pattern, path_lower):
+        for pattern, reason in ARCHIVE_CODE_PATTERNS:
+            if pattern.search(path_lower):
                 reasons.append(reason)
     return len(reasons) > 0, reasons
 
@@ -269,23 +400,24 @@ def compute_staleness_score(signals: List[StalenessSignal]) -> float:
     return min(1.0, base_score + multi_category_bonus)
 
 
+# Lower score bound of each level above ACTIVE, ascending
+SCORE_THRESHOLDS = (0.05, 0.1, 0.25, 0.4, 0.6, 0.8)
+SCORE_LEVELS = (
+    StalenessLevel.ACTIVE,
+    StalenessLevel.CURRENT,
+    StalenessLevel.STABLE,
+    StalenessLevel.REVIEW_NEEDED,
+    StalenessLevel.POTENTIALLY_STALE,
+    StalenessLevel.LIKELY_STALE,
+    StalenessLevel.DEPRECATED,
+)
+
+
 def determine_staleness_level(score: float, is_archived: bool = False) -> StalenessLevel:
     """Determine staleness level from score."""
     if is_archived:
         return StalenessLevel.ARCHIVED
-    if score >= 0.8:
-        return StalenessLevel.DEPRECATED
-    elif score >= 0.6:
-        return StalenessLevel.LIKELY_STALE
-    elif score >= 0.4:
-        return StalenessLevel.POTENTIALLY_STALE
-    elif score >= 0.25:
-        return StalenessLevel.REVIEW_NEEDED
-    elif score >= 0.1:
-        return StalenessLevel.STABLE
-    elif score >= 0.05:
-        return StalenessLevel.CURRENT
-    return StalenessLevel.ACTIVE
+    return SCORE_LEVELS[bisect.bisect_right(SCORE_THRESHOLDS, score)]
 
 
 def get_recommendation(level: StalenessLevel, content_type: str = "code") -> str:
@@ -313,29 +445,32 @@ def assess_staleness(
     content_type: str = "code",
     title: Optional[str] = None,
     use_git: bool = True,
+    known_existing: Optional[Set[str]] = None,
 ) -> StalenessAssessment:
-    """Perform comprehensive staleness assessment."""
+    """Perform comprehensive staleness assessment.
+
+    known_existing: paths the caller already knows exist (e.g. from its own
+    directory scan); when given, it replaces the per-file stat before the
+    git lookup.
+    """
     signals = []
     is_archived = "archive" in path.lower()
     imports = imports or []
     todos = todos or {}
 
     if not is_archived:
-        signals.extend(check_temporal_staleness(days_since_modification))
+        git_commits = -1
+        if use_git:
+            file_path = Path(path)
+            exists = path in known_existing if known_existing is not None else file_path.exists()
+            if exists:
+                git_commits = get_git_commit_count(file_path, days=90)
+        signals.extend(check_temporal_staleness(days_since_modification, git_commits_90d=git_commits))
         signals.extend(check_deprecated_patterns(path, content))
         if imports:
             signals.extend(check_deprecated_imports(imports))
         if todos and lines > 0:
             signals.extend(check_todo_density(todos, lines))
-        if use_git:
-            file_path = Path(path)
-            if file_path.exists():
-                git_commits = get_git_commit_count(file_path, days=90)
-                if git_commits >= 0:
-                    signals.extend(check_temporal_staleness(
-                        days_since_modification,
-                        git_commits_90d=git_commits,
-                    ))
 
     score = compute_staleness_score(signals)
     level = determine_staleness_level(score, is_archived)
@@ -10,7 +10,11 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS
 import numpy as np
 import hashlib
+import json
 import os
+import struct
+import threading
+from collections import OrderedDict
 
 # Limit threading to avoid crashes on Python 3.13 + Apple Silicon
 os.environ['NUMBA_NUM_THREADS'] = '1'
@@ -20,17 +24,176 @@ os.environ['MKL_NUM_THREADS'] = '1'
 
 import umap
 from sklearn.decomposition import PCA
+from sklearn.pipeline import make_pipeline
+
+try:
+    import blake3
+except ImportError:  # Optional: SIMD tree hash, falls back to hashlib
+    blake3 = None
+
+try:
+    from cuml.manifold import UMAP as CumlUMAP
+except ImportError:  # Optional: RAPIDS GPU UMAP on CUDA hosts
+    CumlUMAP = None
 
 app = Flask(__name__)
 CORS(app)
 
-# Cache for reduced embeddings (keyed by content hash)
-reduction_cache = {}
+# Cache for reduced embeddings (keyed by content hash), least recently used first
+reduction_cache = OrderedDict()
+REDUCTION_CACHE_SIZE = 128
+
+# Fitted reducers for recently used results (same keys as reduction_cache), with
+# their raw coordinates, so /reduce-incremental can place new embeddings with
+# transform() instead of refitting; least recently used first
+model_cache = OrderedDict()
+MODEL_CACHE_SIZE = 4
+cache_lock = threading.Lock()
+
+# PCA prefilter ahead of UMAP: the kNN stage is dominated by distance
+# computations in the input dimension, and 50 components keep nearly all of
+# the neighborhood structure of 768-D embeddings
+PCA_PREFILTER_COMPONENTS = 50
+PCA_PREFILTER_MIN_DIM = 64
+
+# Inputs larger than this go to cuML's GPU UMAP when it is installed; below it,
+# GPU setup and transfer cost more than the CPU fit
+GPU_UMAP_MIN_POINTS = 5000
+
+# Requests are served on threads (Flask's threaded server or gunicorn gthread),
+# but numba's threading layer is what crashes on Python 3.13 + Apple Silicon:
+# run one fit/transform at a time, while cache hits proceed concurrently
+fit_lock = threading.Lock()
+
+
+def content_hash_of(*buffers):
+    """16-char hex digest used as the cache key."""
+    hasher = blake3.blake3() if blake3 is not None else hashlib.sha256()
+    for buf in buffers:
+        hasher.update(buf)
+    return hasher.hexdigest()[:16]
+
+
+def with_pca_prefilter(reducer, embeddings):
+    """Chain a PCA prefilter ahead of the reducer if the input is wide enough to benefit.
+
+    The pipeline's transform() applies the same fitted PCA, so
+    /reduce-incremental keeps working on the cached model.
+    """
+    n_components = min(PCA_PREFILTER_COMPONENTS, len(embeddings) - 1)
+    if embeddings.shape[1] <= PCA_PREFILTER_MIN_DIM or n_components < 3:
+        return reducer
+    pca = PCA(n_components=n_components, svd_solver='randomized', random_state=42)
+    return make_pipeline(pca, reducer)
+
+
+def decode_binary_upload(body, headers):
+    """Split an octet-stream /reduce body into (embeddings, ids/metadata dict).
+
+    The body is N × D packed float32/float16 rows, optionally followed by a
+    trailer: a little-endian uint32 byte length, then that many bytes of
+    UTF-8 JSON holding {ids, metadata}. Raises ValueError on a malformed body.
+    """
+    n = int(headers['X-Num-Embeddings'])
+    d = int(headers['X-Dim'])
+    dtype = headers.get('X-Dtype', 'float32')
+    if dtype not in ('float32', 'float16'):
+        raise ValueError(f'unsupported X-Dtype {dtype!r}')
+    if n < 0 or d <= 0:
+        raise ValueError(f'invalid shape [{n}, {d}]')
+
+    rows_end = n * d * np.dtype(dtype).itemsize
+    if len(body) < rows_end:
+        raise ValueError(f'body has {len(body)} bytes, expected at least {rows_end}')
+    # float16 halves the upload; UMAP itself always runs in float32
+    embeddings = np.frombuffer(body, dtype=dtype, count=n * d).reshape(n, d)
+    embeddings = embeddings.astype(np.float32, copy=False)
+
+    data = {}
+    trailer = memoryview(body)[rows_end:]
+    if trailer:
+        if len(trailer) < 4:
+            raise ValueError('truncated metadata length prefix')
+        (meta_len,) = struct.unpack('<I', trailer[:4])
+        if len(trailer) != 4 + meta_len:
+            raise ValueError(f'metadata trailer is {len(trailer) - 4} bytes, prefix says {meta_len}')
+        data = json.loads(bytes(trailer[4:]).decode('utf-8'))
+    return embeddings, data
+
+
+def cache_get(content_hash):
+    """Return a cached result and mark it most recently used."""
+    with cache_lock:
+        result = reduction_cache.get(content_hash)
+        if result is not None:
+            reduction_cache.move_to_end(content_hash)
+        return result
+
+
+def cache_put(content_hash, result):
+    """Cache a result, evicting the least recently used beyond REDUCTION_CACHE_SIZE."""
+    with cache_lock:
+        reduction_cache[content_hash] = result
+        reduction_cache.move_to_end(content_hash)
+        while len(reduction_cache) > REDUCTION_CACHE_SIZE:
+            reduction_cache.popitem(last=False)
+
+
+def model_get(content_hash):
+    """Return a (reducer, raw_coords, method) entry and mark it most recently used."""
+    with cache_lock:
+        entry = model_cache.get(content_hash)
+        if entry is not None:
+            model_cache.move_to_end(content_hash)
+        return entry
+
+
+def remember_model(content_hash, reducer, raw_coords, method):
+    """Keep a fitted reducer, evicting the least recently used beyond MODEL_CACHE_SIZE."""
+    with cache_lock:
+        model_cache[content_hash] = (reducer, raw_coords, method)
+        model_cache.move_to_end(content_hash)
+        while len(model_cache) > MODEL_CACHE_SIZE:
+            model_cache.popitem(last=False)
+
+
+def length_mismatch(count, ids, metadata):
+    """Return an error message unless ids and metadata have one entry per embedding."""
+    for name, values in (('ids', ids), ('metadata', metadata)):
+        if not isinstance(values, list) or len(values) != count:
+            return f'{name} must be a list with one entry per embedding ({count})'
+    return None
+
+
+def build_points(coords_3d, ids, metadata):
+    """Normalize coords to the [-1, 1] range for Three.js and pair them with ids/metadata.
+
+    Callers check the lengths with length_mismatch first; zip would otherwise
+    silently drop points.
+    """
+    # One copy (the raw coords stay in model_cache), then normalize in place
+    coords_3d = coords_3d.astype(np.float32)
+    mins = coords_3d.min(axis=0)
+    half_ranges = (coords_3d.max(axis=0) - mins + 1e-8) * 0.5  # Avoid division by zero
+    np.subtract(coords_3d, mins, out=coords_3d)
+    np.divide(coords_3d, half_ranges, out=coords_3d)
+    np.subtract(coords_3d, 1.0, out=coords_3d)
+
+    # One C-level conversion to Python floats instead of 3N scalar lookups
+    return [
+        {'id': point_id, 'x': x, 'y': y, 'z': z, 'metadata': meta}
+        for point_id, (x, y, z), meta in zip(ids, coords_3d.tolist(), metadata)
+    ]
 
 
 @app.route('/health', methods=['GET'])
 def health():
-    return jsonify({'status': 'ok', 'service': 'umap-reducer'})
+    return jsonify({
+        'status': 'ok',
+        'service': 'umap-reducer',
+        'cache_size': len(reduction_cache),
+        'cache_max': REDUCTION_CACHE_SIZE,
+    })
 
 
 @app.route('/reduce', methods=['POST'])
@@ -39,42 +202,69 @@ def reduce_embeddings():
     Reduce high-dimensional embeddings to 3D.
 
     Input: { embeddings: [[...768 floats...], ...], ids: [...], metadata: [...] }
+       or: application/octet-stream body of packed float32 (or, with
+           X-Dtype: float16, half precision) rows, shaped by the
+           X-Num-Embeddings / X-Dim headers, optionally followed by a
+           length-prefixed JSON trailer with ids/metadata (preferred: no
+           per-float parsing; see decode_binary_upload)
     Output: { points: [{ id, x, y, z, metadata }, ...] }
     """
-    global reduction_cache
-
-    data = request.json
-    if not data or 'embeddings' not in data:
-        return jsonify({'error': 'Missing embeddings field'}), 400
+    if request.mimetype == 'application/octet-stream':
+        try:
+            embeddings, data = decode_binary_upload(request.get_data(), request.headers)
+        except (KeyError, ValueError) as e:
+            return jsonify({'error': f'Invalid binary embeddings payload: {e}'}), 400
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Metadata trailer must be a JSON object'}), 400
+    else:
+        data = request.json
+        if not isinstance(data, dict) or 'embeddings' not in data:
+            return jsonify({'error': 'Missing embeddings field'}), 400
+        embeddings = np.array(data['embeddings'], dtype=np.float32)
 
-    embeddings = np.array(data['embeddings'], dtype=np.float32)
     ids = data.get('ids', [str(i) for i in range(len(embeddings))])
     metadata = data.get('metadata', [{}] * len(embeddings))
+    error = length_mismatch(len(embeddings), ids, metadata)
+    if error:
+        return jsonify({'error': error}), 400
 
     if len(embeddings) < 5:
         return jsonify({'error': 'Need at least 5 embeddings for UMAP', 'points': []}), 400
 
     # Hash for cache key
-    content_hash = hashlib.sha256(embeddings.tobytes()).hexdigest()[:16]
+    content_hash = content_hash_of(memoryview(np.ascontiguousarray(embeddings)).cast('B'))
 
-    if content_hash in reduction_cache:
-        return jsonify(reduction_cache[content_hash])
+    cached = cache_get(content_hash)
+    if cached is not None:
+        return jsonify(cached)
 
     # Try UMAP first, fall back to PCA if it crashes (common on Python 3.13 + Apple Silicon)
     n_neighbors = min(15, max(2, len(embeddings) - 1))
     method_used = 'umap'
 
     try:
-        reducer = umap.UMAP(
-            n_components=3,
-            n_neighbors=n_neighbors,
-            min_dist=0.1,
-            metric='cosine',
-            random_state=42,
-            n_jobs=1,  # Single-threaded to avoid crashes
-            low_memory=True  # Reduce memory pressure
-        )
-        coords_3d = reducer.fit_transform(embeddings)
+        if CumlUMAP is not None and len(embeddings) > GPU_UMAP_MIN_POINTS:
+            method_used = 'umap-gpu'
+            reducer = CumlUMAP(
+                n_components=3,
+                n_neighbors=n_neighbors,
+                min_dist=0.1,
+                metric='cosine',
+                random_state=42,
+            )
+        else:
+            reducer = umap.UMAP(
+                n_components=3,
+                n_neighbors=n_neighbors,
+                min_dist=0.1,
+                metric='cosine',
+                random_state=42,
+                n_jobs=1,  # Single-threaded to avoid crashes
+                low_memory=True  # Reduce memory pressure
+            )
+        reducer = with_pca_prefilter(reducer, embeddings)
+        with fit_lock:
+            coords_3d = reducer.fit_transform(embeddings)
     except Exception as e:
         # Fallback to PCA if UMAP crashes
         print(f'UMAP failed ({e}), falling back to PCA')
@@ -82,36 +272,90 @@ def reduce_embeddings():
         reducer = PCA(n_components=3, random_state=42)
         coords_3d = reducer.fit_transform(embeddings)
 
-    # Normalize to [-1, 1] range for Three.js
-    mins = coords_3d.min(axis=0)
-    maxs = coords_3d.max(axis=0)
-    ranges = maxs - mins + 1e-8  # Avoid division by zero
-    coords_3d = (coords_3d - mins) / ranges
-    coords_3d = coords_3d * 2 - 1
-
-    points = [
-        {
-            'id': ids[i],
-            'x': float(coords_3d[i, 0]),
-            'y': float(coords_3d[i, 1]),
-            'z': float(coords_3d[i, 2]),
-            'metadata': metadata[i]
-        }
-        for i in range(len(coords_3d))
-    ]
+    remember_model(content_hash, reducer, coords_3d, method_used)
+    points = build_points(coords_3d, ids, metadata)
 
     result = {'points': points, 'hash': content_hash, 'count': len(points), 'method': method_used}
-    reduction_cache[content_hash] = result
+    cache_put(content_hash, result)
+
+    return jsonify(result)
+
+
+@app.route('/reduce-incremental', methods=['POST'])
+def reduce_incremental():
+    """
+    Add embeddings to a previous /reduce result without refitting.
+
+    Input: { base_hash, new_embeddings: [[...768 floats...], ...], ids: [...], metadata: [...] }
+    (ids/metadata describe the new embeddings)
+    Output: same as /reduce, covering the base points followed by the new ones.
+    The returned hash can be used as base_hash for further additions.
+    """
+    data = request.json
+    if not data or 'base_hash' not in data or 'new_embeddings' not in data:
+        return jsonify({'error': 'Missing base_hash or new_embeddings field'}), 400
+
+    base_hash = data['base_hash']
+    base_result = cache_get(base_hash)
+    base_model = model_get(base_hash)
+    if base_model is None or base_result is None:
+        return jsonify({'error': f'No fitted model for hash {base_hash}; call /reduce first'}), 404
+    reducer, base_coords, method_used = base_model
+
+    try:
+        new_embeddings = np.array(data['new_embeddings'], dtype=np.float32)
+    except (TypeError, ValueError):
+        new_embeddings = None  # Ragged rows or non-numeric values
+    if new_embeddings is None or new_embeddings.ndim != 2 or len(new_embeddings) == 0:
+        return jsonify({'error': 'new_embeddings must be a non-empty list of vectors'}), 400
+
+    base_points = base_result['points']
+    new_ids = data.get('ids', [str(len(base_points) + i) for i in range(len(new_embeddings))])
+    new_metadata = data.get('metadata', [{}] * len(new_embeddings))
+    error = length_mismatch(len(new_embeddings), new_ids, new_metadata)
+    if error:
+        return jsonify({'error': error}), 400
+    ids = [p['id'] for p in base_points] + new_ids
+    metadata = [p['metadata'] for p in base_points] + new_metadata
+
+    # The new ids/metadata are part of the key: a hit returns them verbatim
+    content_hash = content_hash_of(
+        base_hash.encode(),
+        memoryview(new_embeddings).cast('B'),
+        json.dumps([new_ids, new_metadata], sort_keys=True, default=str).encode(),
+    )
+    cached = cache_get(content_hash)
+    if cached is not None:
+        return jsonify(cached)
+
+    try:
+        with fit_lock:
+            new_coords = reducer.transform(new_embeddings)
+        coords_3d = np.concatenate([base_coords, new_coords])
+    except ValueError as e:
+        return jsonify({'error': f'Cannot transform new_embeddings: {e}'}), 400
+
+    remember_model(content_hash, reducer, coords_3d, method_used)
+    points = build_points(coords_3d, ids, metadata)
+
+    result = {
+        'points': points,
+        'hash': content_hash,
+        'count': len(points),
+        'method': f'{method_used}-incremental',
+    }
+    cache_put(content_hash, result)
 
     return jsonify(result)
 
 
 @app.route('/clear-cache', methods=['POST'])
 def clear_cache():
-    """Clear the reduction cache."""
-    global reduction_cache
-    count = len(reduction_cache)
-    reduction_cache = {}
+    """Clear the reduction cache and the fitted models."""
+    with cache_lock:
+        count = len(reduction_cache)
+        reduction_cache.clear()
+        model_cache.clear()
     return jsonify({'cleared': count})
 
 
@@ -0,0 +1,6 @@
+"""
+WSGI entry point for running the UMAP service under gunicorn:
+
+    gunicorn -w 1 -k gthread --threads 4 -b 0.0.0.0:5003 --timeout 120 wsgi:app
+"""
+from umap_server import app  # noqa: F401